@@ -0,0 +1,744 @@
+import re
+from hashlib import blake2b
+from typing import (
+    Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+)
+
+import numpy as np
+import pandas as pd
+
+from .parsers import STATION_COLUMNS
+
+
+def _days(index: pd.Index) -> np.ndarray:
+    """Dates of an index as the number of days since 1970-01-01."""
+    return pd.DatetimeIndex(index).values.astype('datetime64[D]').astype('i8')
+
+
+def _layers(df_station: pd.DataFrame):
+    """Splits a station in layers without repeated dates. Almost every station
+    has a single layer; a repeated date goes to a second one, so it still
+    counts as one more value of that day, as in a groupby.
+    """
+    if df_station.index.is_unique:
+        yield df_station
+        return
+
+    rank = df_station.groupby(level=0).cumcount().to_numpy()
+
+    for k in range(rank.max() + 1):
+        yield df_station[rank == k]
+
+
+def nanmedian_rows(matrix: np.ndarray) -> np.ndarray:
+    """Median of each column of `matrix` ignoring NaN; NaN if there are no
+    values.
+
+    The columns are sorted once (NaN go to the end) and the middle values
+    are picked by the count of values of each column, which is much faster
+    than `numpy.nanmedian` along an axis.
+    """
+    counts = np.count_nonzero(~np.isnan(matrix), axis=0)
+    if matrix.shape[0] == 0:
+        return np.full(matrix.shape[1], np.nan)
+
+    ordered = np.sort(matrix, axis=0)
+    low = np.take_along_axis(
+        ordered, np.maximum(counts - 1, 0)[np.newaxis] // 2, axis=0
+    )[0]
+    high = np.take_along_axis(ordered, (counts // 2)[np.newaxis], axis=0)[0]
+
+    median = (low + high) / 2
+    median[counts == 0] = np.nan
+
+    return median
+
+
+def shared_calendar(frames: Sequence[pd.DataFrame]) -> np.ndarray:
+    """Sorted days (since 1970-01-01) with data in at least one station,
+    found with a mask over the range of days instead of sorting.
+    """
+    days = np.concatenate([_days(df_station.index) for df_station in frames])
+    first = days.min()
+
+    present = np.zeros(days.max() - first + 1, dtype=bool)
+    present[days - first] = True
+
+    return np.flatnonzero(present) + first
+
+
+def align_stations(
+    frames: Sequence[pd.DataFrame],
+    columns: List[str],
+    calendar: np.ndarray
+) -> Iterator[Tuple[str, np.ndarray]]:
+    """Aligns the columns of many stations on a shared calendar, one column
+    at a time.
+
+    Args:
+        frames: Data frames of the stations, indexed by date.
+
+        columns: Names of the columns.
+
+        calendar: Sorted days (since 1970-01-01) that contain every date of
+            the stations.
+
+    Yields:
+        Pairs (column, array of shape (layers, days)), with one layer per
+        station (more if a station has repeated dates) and NaN where there
+        are no values.
+    """
+    layers = [
+        (
+            np.searchsorted(calendar, _days(layer.index)),
+            layer[columns].to_numpy(dtype='float64')
+        )
+        for df_station in frames for layer in _layers(df_station)
+    ]
+
+    for j, column in enumerate(columns):
+        matrix = np.full((len(layers), len(calendar)), np.nan)
+        for k, (positions, values) in enumerate(layers):
+            matrix[k, positions] = values[:, j]
+
+        yield column, matrix
+
+
+def station_matrix(
+    frames: Sequence[pd.DataFrame],
+    column: str,
+    first: int,
+    last: int
+) -> np.ndarray:
+    """Values of one column of many stations on the days `first` to `last` 
+    (days since 1970-01-01).
+
+    Returns:
+        Array of shape (stations, days), NaN where a station has no data.
+    """
+    matrix = np.full((len(frames), last - first + 1), np.nan)
+    for row, df_station in enumerate(frames):
+        days = _days(df_station.index)
+        inside = (days >= first) & (days <= last)
+        matrix[row, days[inside] - first] = \
+            df_station[column].to_numpy(dtype='float64')[inside]
+
+    return matrix
+
+
+def daily_median(
+    frames: Sequence[pd.DataFrame],
+    columns: List[str] = STATION_COLUMNS
+) -> pd.DataFrame:
+    """Median of each day across stations, the same result as concatenating
+    the frames and doing `groupby('date').median()`, without the repeated
+    copies of the concatenation.
+
+    Every column is aligned into a 2-D array (stations × days) over the
+    calendar of all the dates of the stations, and its NaN-aware median is
+    computed in one vectorized pass. Only one column is in memory at a time.
+
+    Args:
+        frames: Data frames of the stations, indexed by date.
+
+        columns: Columns to aggregate.
+
+    Returns:
+        DataFrame indexed by `date` with the median of each column.
+    """
+    frames = [df_station for df_station in frames if len(df_station)]
+    if not frames:
+        return pd.DataFrame(columns=columns, dtype='float64',
+                            index=pd.DatetimeIndex([], name='date'))
+
+    calendar = shared_calendar(frames)
+
+    data = {
+        column: nanmedian_rows(matrix)
+        for column, matrix in align_stations(frames, columns, calendar)
+    }
+
+    index = pd.DatetimeIndex(
+        calendar.astype('datetime64[D]').astype('datetime64[ns]'), name='date'
+    )
+
+    return pd.DataFrame(data, index=index)
+
+
+# Bins of the quantile sketches: (lowest value, highest value, width).
+SKETCH_BINS = {
+    'rainfall': (0., 500., 0.5),
+    'evaporation': (0., 50., 0.1),
+    'max_t': (-20., 60., 0.1),
+    'min_t': (-40., 50., 0.1),
+}
+
+# Extra days allocated each time the calendar of a sketch grows.
+_SKETCH_SLACK = 3650
+
+
+class DailyQuantileSketch():
+    """Streaming sketch of the distribution of each day across stations.
+
+    Stations are added one at a time with `update`, and for every column and 
+    day only a histogram of counts is kept, with bins of fixed width centered 
+    on `low + k * width`. Memory is proportional to the number of days (times 
+    the bins of each column) and does not depend on the number of stations.
+
+    Error bound: for every day, a quantile estimated by `quantiles` differs 
+    from the exact one (linear interpolation between order statistics, as in 
+    pandas and numpy) by at most `width / 2` of its column, as long as the 
+    values involved are within [low, high]. Values outside the range are 
+    counted in the nearest edge bin. Since the source data has one decimal, 
+    columns with `width` 0.1 give exact quantiles.
+
+    Attributes:
+
+        bins(dict): Column -> (low, high, width), default `SKETCH_BINS`.
+
+        stations(int): Number of stations added.
+
+    Methods:
+
+        update: Adds the data frame of a station.
+
+        quantiles: DataFrame with the estimated quantiles of each day.
+
+        median: DataFrame with the estimated median of each day.
+    """
+
+    def __init__(self, bins: dict = SKETCH_BINS, dtype: str = 'uint16'):
+        self.bins = dict(bins)
+        self.dtype = dtype
+        self.stations = 0
+
+        self._first = None
+        self._present = np.zeros(0, dtype=bool)
+        self._counts = {
+            column: np.zeros((0, self._size(column)), dtype=dtype)
+            for column in self.bins
+        }
+
+    def _size(self, column: str) -> int:
+        low, high, width = self.bins[column]
+        return int(round((high - low) / width)) + 1
+
+    def _grow(self, first: int, last: int) -> None:
+        if self._first is None:
+            self._first = first
+
+        current_last = self._first + len(self._present) - 1
+        if first >= self._first and last <= current_last:
+            return
+
+        new_first = min(first, self._first)
+        if new_first < self._first:
+            new_first -= _SKETCH_SLACK
+        new_last = max(last, current_last)
+        if new_last > current_last:
+            new_last += _SKETCH_SLACK
+
+        before = self._first - new_first
+        after = new_last - current_last
+
+        self._present = np.pad(self._present, (before, after))
+        for column, counts in self._counts.items():
+            self._counts[column] = np.pad(counts, ((before, after), (0, 0)))
+        self._first = new_first
+
+    def update(self, df_station: pd.DataFrame) -> None:
+        """Adds the values of a station to the histograms of its days."""
+        if not len(df_station):
+            return
+
+        days = _days(df_station.index)
+        self._grow(days.min(), days.max())
+        rows = days - self._first
+        self._present[rows] = True
+
+        unique = df_station.index.is_unique
+        for column, (low, high, width) in self.bins.items():
+            values = df_station[column].to_numpy(dtype='float64')
+            valid = ~np.isnan(values)
+            bins = np.clip(np.rint((values[valid] - low) / width), 0, 
+                           self._size(column) - 1).astype(np.intp)
+
+            if unique:
+                # Every pair (day, bin) appears once, so fancy indexing works.
+                self._counts[column][rows[valid], bins] += 1
+            else:
+                np.add.at(self._counts[column], (rows[valid], bins), 1)
+
+        self.stations += 1
+
+    def _column_quantiles(
+        self,
+        column: str,
+        quantiles: Sequence[float],
+        rows: np.ndarray,
+        chunk: int = 4096
+    ) -> List[np.ndarray]:
+        low, _, width = self.bins[column]
+        results = [np.full(len(rows), np.nan) for _ in quantiles]
+
+        for start in range(0, len(rows), chunk):
+            counts = self._counts[column][rows[start:start + chunk]]
+            cumulative = np.cumsum(counts, axis=1, dtype=np.int64)
+            n = cumulative[:, -1]
+            has_values = n > 0
+
+            for result, q in zip(results, quantiles):
+                rank = q * np.maximum(n - 1, 0)
+                below = np.floor(rank)
+                above = np.ceil(rank)
+                # Bin of the order statistics `below` and `above`.
+                bin_below = (cumulative <= below[:, np.newaxis]).sum(axis=1)
+                bin_above = (cumulative <= above[:, np.newaxis]).sum(axis=1)
+
+                value = low + width * (
+                    bin_below + (rank - below) * (bin_above - bin_below)
+                )
+                result[start:start + chunk] = np.where(has_values, value, 
+                                                       np.nan)
+
+        return results
+
+    def quantiles(
+        self,
+        quantiles: Sequence[float] = (0.1, 0.5, 0.9),
+        columns: List[str] = None
+    ) -> pd.DataFrame:
+        """Estimated quantiles of each day with data.
+
+        Args:
+            quantiles: Quantiles between 0 and 1.
+
+            columns: Columns of the result. Default is every column of `bins`.
+
+        Returns:
+            DataFrame indexed by `date` with a column `{column}_p{percent}` 
+            (for example `rainfall_p90`) for each column and quantile.
+        """
+        columns = columns or list(self.bins)
+        rows = np.flatnonzero(self._present)
+
+        data = {}
+        for column in columns:
+            estimates = self._column_quantiles(column, quantiles, rows)
+            for q, values in zip(quantiles, estimates):
+                data[f'{column}_p{round(q * 100):02d}'] = values
+
+        index = pd.DatetimeIndex(
+            (rows + (self._first or 0)).astype('datetime64[D]')
+            .astype('datetime64[ns]'), 
+            name='date'
+        )
+
+        return pd.DataFrame(data, index=index)
+
+    def median(self, columns: List[str] = None) -> pd.DataFrame:
+        """Estimated median of each day, with the columns of `daily_median`."""
+        columns = columns or list(self.bins)
+        df_median = self.quantiles([0.5], columns)
+        df_median.columns = columns
+
+        return df_median
+
+
+def sketch_median(
+    frames: Iterable[pd.DataFrame],
+    bins: dict = SKETCH_BINS
+) -> pd.DataFrame:
+    """Median of each day estimated with a DailyQuantileSketch, reading the 
+    stations one at a time.
+    """
+    sketch = DailyQuantileSketch(bins)
+    for df_station in frames:
+        sketch.update(df_station)
+
+    return sketch.median(STATION_COLUMNS)
+
+
+def _trim_days(df_station: pd.DataFrame, first: int, last: int) -> pd.DataFrame:
+    days = _days(df_station.index)
+    return df_station[(days >= first) & (days <= last)]
+
+
+def frame_hash(df_station: pd.DataFrame, last: int = None) -> str:
+    """Hash of the dates and values of a station, only up to the day `last` 
+    (days since 1970-01-01) when it is given.
+    """
+    if last is not None:
+        df_station = df_station[_days(df_station.index) <= last]
+
+    digest = blake2b(digest_size=16)
+    digest.update(pd.DatetimeIndex(df_station.index).values
+                  .astype('datetime64[ns]').tobytes())
+    digest.update(df_station[STATION_COLUMNS].to_numpy('float64').tobytes())
+
+    return digest.hexdigest()
+
+
+def station_source(
+    df_station: pd.DataFrame,
+    signature: dict,
+    previous: dict = None
+) -> Tuple[dict, Optional[Tuple[int, int]]]:
+    """Describes a station used in the medians of a region and finds the days 
+    whose values may have changed since it was described as `previous`.
+
+    Args:
+        df_station: Data frame of the station.
+
+        signature: Signature of its raw file (size, time and digest).
+
+        previous: Description returned before, None for a new station.
+
+    Returns:
+        The description (the signature with the `first` and `last` days, 
+        since 1970-01-01, and the hash of the data) and the pair of the first 
+        and last changed days, or None if nothing changed. When only new days 
+        were appended, just those are changed.
+    """
+    if previous is not None and previous.get('digest') == signature['digest']:
+        return previous | signature, None
+
+    days = _days(df_station.index)
+    if len(days):
+        source = signature | {
+            'first': int(days.min()), 
+            'last': int(days.max()), 
+            'hash': frame_hash(df_station)
+        }
+    else:
+        source = signature | {'first': None, 'last': None, 'hash': None}
+
+    spans = [
+        (description['first'], description['last']) 
+        for description in (previous, source) 
+        if description is not None and description['first'] is not None
+    ]
+    if not spans:
+        return source, None
+
+    if previous is not None and previous['first'] is not None \
+            and source['first'] is not None \
+            and frame_hash(df_station, previous['last']) == previous['hash']:
+        # The old days are the same, only the new ones have changed.
+        if source['last'] == previous['last']:
+            return source, None
+        return source, (previous['last'] + 1, source['last'])
+
+    return source, (min(span[0] for span in spans), 
+                    max(span[1] for span in spans))
+
+
+def update_daily_median(
+    df_cached: pd.DataFrame,
+    frames: Callable[[], Iterable[pd.DataFrame]],
+    first: int,
+    last: int,
+    bounds: Tuple[int, int],
+    median: Callable[[Iterable[pd.DataFrame]], pd.DataFrame] = daily_median
+) -> Tuple[pd.DataFrame, int, int]:
+    """Recomputes the interpolated daily medians of the days `first` to `last` 
+    (days since 1970-01-01) and puts them in place of the cached ones.
+
+    The interpolation of a day depends on its nearest values, so the days are 
+    widened up to the closest day at each side with all the columns observed, 
+    which keeps its value. The result is the same as computing the medians of 
+    the whole history again.
+
+    Args:
+        df_cached: Interpolated daily medians computed before, indexed by date.
+
+        frames: Function that returns the data frames of all the stations of 
+            the region, it is called again if the window has to grow.
+
+        first, last: Days whose values changed in at least one station.
+
+        bounds: First and last day with data in any station.
+
+        median: Function with the median of each day of many stations, 
+            `daily_median` or `sketch_median`.
+
+    Returns:
+        The updated data frame, and the first and last day that were replaced.
+    """
+    lookback = 366
+    while True:
+        low, high = first - lookback, last + lookback
+        df_raw = median(_trim_days(df_station, low, high) 
+                        for df_station in frames())
+        days = _days(df_raw.index)
+        complete = df_raw.notna().all(axis=1).to_numpy()
+
+        before = days[complete & (days < first)]
+        after = days[complete & (days > last)]
+        if (before.size or low <= bounds[0]) \
+                and (after.size or high >= bounds[1]):
+            break
+        lookback *= 2
+
+    left = before.max() if before.size else np.iinfo(np.int64).min
+    right = after.min() if after.size else np.iinfo(np.int64).max
+
+    df_window = df_raw[(days >= left) & (days <= right)]\
+        .interpolate(method='time')
+
+    cached_days = _days(df_cached.index)
+    replaced = cached_days[(cached_days >= left) & (cached_days <= right)]
+    changed = np.concatenate([_days(df_window.index), replaced])
+
+    df_all = pd.concat([
+        df_cached[cached_days < left], 
+        df_window, 
+        df_cached[cached_days > right]
+    ])
+
+    if not changed.size:
+        return df_all, first, last
+
+    return df_all, int(changed.min()), int(changed.max())
+
+
+# Calendar column kept by default in the periodic medians of each frequency.
+PERIOD_KEYS = {
+    'D': ['day_of_year'], 
+    'W': ['day_of_year'], 
+    'M': ['month'], 
+    'Q': ['month'], 
+    'Y': [],
+}
+
+# Custom windows of N days, for example `10D`.
+_r_n_days = re.compile(r'^(\d+)D$')
+
+
+def _n_days(frequency: Union[str, int]) -> Optional[int]:
+    """Length of a custom window of days, or None for a calendar frequency."""
+    if isinstance(frequency, (int, np.integer)):
+        return int(frequency)
+
+    match = _r_n_days.match(frequency)
+    if match is None:
+        assert frequency in PERIOD_KEYS, f"Unknown frequency {frequency}."
+        return None
+
+    return int(match.group(1))
+
+
+def period_codes(days: np.ndarray, frequency: Union[str, int]) -> np.ndarray:
+    """Integer code of the period that contains each day, increasing with the 
+    date, computed with arithmetic on the days instead of a PeriodIndex.
+
+    Args:
+        days: Days since 1970-01-01.
+
+        frequency: `D`, `W` (weeks from Monday to Sunday, as pandas), `M`, 
+            `Q`, `Y` or a window of N days (`'10D'` or 10). The windows of N 
+            days are counted from 1970-01-01, so they do not move when new 
+            days are added.
+
+    Returns:
+        Array with the code of each day.
+    """
+    n_days = _n_days(frequency)
+    if n_days is not None:
+        return days // n_days
+    if frequency == 'D':
+        return days
+    if frequency == 'W':
+        # 1970-01-01 is a Thursday, weeks start 3 days before.
+        return (days + 3) // 7
+
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype('i8')
+    if frequency == 'M':
+        return months
+    if frequency == 'Q':
+        return months // 3
+
+    return months // 12
+
+
+def period_starts(codes: np.ndarray, frequency: Union[str, int]) -> np.ndarray:
+    """First day (since 1970-01-01) of the periods with the given codes."""
+    n_days = _n_days(frequency)
+    if n_days is not None:
+        return codes * n_days
+    if frequency == 'D':
+        return codes
+    if frequency == 'W':
+        return codes * 7 - 3
+
+    months = {'M': 1, 'Q': 3, 'Y': 12}[frequency] * codes
+    return months.astype('datetime64[M]').astype('datetime64[D]').astype('i8')
+
+
+def periodic_medians(
+    df_daily: pd.DataFrame,
+    frequencies: Sequence[Union[str, int]] = ('W', 'M'),
+    columns: List[str] = STATION_COLUMNS,
+    rainy_threshold: float = 2.5,
+    keys: List[str] = None
+) -> Dict[Union[str, int], pd.DataFrame]:
+    """Median of each column by period, for many frequencies at once, with 
+    the number of rainy days of each period.
+
+    The calendar of the days (day of year, month, rainy days) is computed 
+    once and shared by every frequency, and each frequency is a single 
+    grouped pass over all the columns, on integer codes of its periods. The 
+    source data frame is not changed.
+
+    Args:
+        df_daily: Daily values indexed by date.
+
+        frequencies: Frequencies of `period_codes`, for example 
+            `['W', 'M', '10D']`.
+
+        columns: Columns whose median is computed.
+
+        rainy_threshold: Rainfall in mm from which a day is rainy.
+
+        keys: Calendar columns (`day_of_year`, `month`) of every result, 
+            with their median as integer. Default is `PERIOD_KEYS`.
+
+    Returns:
+        Dict with a data frame for each frequency, indexed by the first 
+        `date` of each period with data, with the median of `columns`, 
+        `rainy_days` and the calendar columns.
+    """
+    if not df_daily.index.is_monotonic_increasing:
+        df_daily = df_daily.sort_index()
+
+    days = _days(df_daily.index)
+    dates = pd.DatetimeIndex(df_daily.index)
+
+    # Shared by every frequency.
+    values = df_daily[columns].to_numpy(dtype='float64')
+    rainy = (df_daily['rainfall'] >= rainy_threshold).to_numpy(np.int64)
+    calendar = {
+        'day_of_year': dates.dayofyear.to_numpy(np.int64),
+        'month': dates.month.to_numpy(np.int64),
+    }
+
+    results = {}
+    for frequency in frequencies:
+        n_days = _n_days(frequency)
+        frequency_keys = keys if keys is not None \
+            else PERIOD_KEYS['D' if n_days else frequency]
+
+        codes = period_codes(days, frequency)
+        # The days are sorted, so each period is a contiguous block.
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+
+        df_values = pd.DataFrame(
+            np.column_stack(
+                [values] + [calendar[key] for key in frequency_keys]
+            ).astype('float64') if len(days) else 
+            np.empty((0, len(columns) + len(frequency_keys))),
+            columns=columns + frequency_keys
+        )
+        df_period = df_values.groupby(codes, sort=False).median()
+
+        df_period.insert(
+            len(columns), 'rainy_days', 
+            np.add.reduceat(rainy, starts) if len(days) 
+            else np.zeros(0, dtype=np.int64)
+        )
+        for key in frequency_keys:
+            df_period[key] = df_period[key].astype(int)
+
+        df_period.index = pd.DatetimeIndex(
+            period_starts(codes[starts], frequency).astype('datetime64[D]')
+            .astype('datetime64[ns]'), 
+            name='date'
+        )
+        results[frequency] = df_period
+
+    return results
+
+
+# Longest jump between consecutive periods of the same segment.
+MAX_GAP = np.timedelta64(31, 'D')
+
+
+def gap_segments(
+    index: pd.DatetimeIndex,
+    max_gap: np.timedelta64 = MAX_GAP
+) -> np.ndarray:
+    """Label of the contiguous segment of each date of a sorted index: a new 
+    segment starts after every jump longer than `max_gap`.
+    """
+    dates = pd.DatetimeIndex(index).values
+    return np.r_[0, np.cumsum(np.diff(dates) > max_gap)][:len(dates)]
+
+
+def lag_frame(
+    df: pd.DataFrame,
+    independent_vars: Sequence[str] = ('rainfall', 'rainy_days'),
+    n: Union[int, Sequence[int]] = 1,
+    segments: np.ndarray = None
+) -> pd.DataFrame:
+    """Lags every column but the `independent_vars` by `n` rows, without 
+    crossing the borders of the segments. The independent vars are also 
+    lagged, as copies, so their past values are available.
+
+    The rows of each segment are found from their labels at once, and the 
+    lagged values are taken by position, so there is no loop over the 
+    segments and the dtypes are kept. `df` is not changed.
+
+    Args:
+        df: Data frame sorted by its index.
+
+        independent_vars: Columns that are not lagged.
+
+        n: Rows to lag, or a list of them to get several lags at once.
+
+        segments: Label of the segment of each row, as `gap_segments`. 
+            Default is a single segment.
+
+    Returns:
+        Data frame without the first rows of each segment, which have no 
+        past values. With an integer `n` its columns are `{column}_copy` 
+        for the lagged independent vars, the other lagged columns with 
+        their names and then the independent vars. With a list, the lagged 
+        columns of each lag are named `{column}_lag{lag}`.
+    """
+    lags = [n] if np.isscalar(n) else list(n)
+    assert lags and min(lags) >= 1, "The lags have to be positive."
+
+    size = len(df)
+    rows = np.arange(size)
+    if segments is None:
+        segments = np.zeros(size, dtype=np.int64)
+    segments = np.asarray(segments)
+
+    # Position of each row inside its segment.
+    starts = np.flatnonzero(np.r_[True, segments[1:] != segments[:-1]])\
+        if size else rows
+    position = rows - np.repeat(starts, np.diff(np.r_[starts, size]))
+    kept = rows[position >= max(lags)]
+
+    independent = list(independent_vars)
+    lagged = independent[::-1] \
+        + [column for column in df.columns if column not in independent]
+    index = df.index[kept]
+
+    frames = []
+    for lag in lags:
+        if np.isscalar(n):
+            names = [
+                f'{column}_copy' if column in independent else column 
+                for column in lagged
+            ]
+        else:
+            names = [f'{column}_lag{lag}' for column in lagged]
+
+        frames.append(
+            df[lagged].iloc[kept - lag].set_axis(index, axis=0)
+            .set_axis(names, axis=1)
+        )
+    frames.append(df[independent].iloc[kept])
+
+    return pd.concat(frames, axis=1)
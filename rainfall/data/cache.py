@@ -0,0 +1,434 @@
+import json
+import sqlite3
+from collections import OrderedDict
+from contextlib import closing
+from hashlib import blake2b
+from os import makedirs, remove, scandir, stat
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Any, Optional, Tuple
+
+import pandas as pd
+
+
+# The frames of the MemoryCache are handed out as shallow copies, views of 
+# the same values. With Copy-on-Write a change to a view copies its values 
+# first, so it never reaches the frame kept. It is always on from pandas 3.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+# Version of the code that derives each kind of frame. It has to be increased
+# when the parsing or the aggregation change: the frames stored before get
+# other keys, so they are not used anymore and are evicted in time.
+PIPELINE_VERSION = {
+    'catalog': 1,
+    'station': 1,
+    'daily': 1,
+    'periodic': 1,
+    'grid': 1,
+}
+
+# Disk budget of a new cache, 10 GiB.
+DEFAULT_BUDGET_BYTES = 10 << 30
+
+# Memory budget of the frames kept by the process, 1 GiB.
+DEFAULT_MEMORY_BYTES = 1 << 30
+
+# Temporary files older than this (in seconds) were left by an interrupted
+# write.
+STALE_TMP_SECONDS = 3600
+
+# Files not in the index that are newer than this (in seconds) may be written 
+# by another process that has not registered them yet.
+ORPHAN_GRACE_SECONDS = 600
+
+# Interval (in seconds) between the searches of orphans made by `register`.
+ORPHAN_SCAN_SECONDS = 3600
+
+
+def cache_key(kind: str, params: dict, inputs=None) -> str:
+    """Hash of everything a derived frame depends on: its kind, the version
+    of the code that derives it, its parameters and a description of its
+    inputs (digests or signatures of the files it is computed from).
+
+    Without `inputs` it is the key of the family of the frame, the same for
+    every version of its inputs.
+    """
+    digest = blake2b(digest_size=16)
+    digest.update(json.dumps(
+        [kind, PIPELINE_VERSION[kind], params, inputs],
+        sort_keys=True, default=str
+    ).encode())
+
+    return digest.hexdigest()
+
+
+class DerivedCache():
+    """Content addressed store of the derived frames, with an index of the
+    entries kept in a sqlite database so many processes can share it.
+
+    Each frame is a file `{kind}/{key}.ftr` named by its `cache_key`, so a
+    new version of the code, of the parameters or of the inputs never reads
+    an old file. The entries are evicted by least recent use once the files
+    take more than the disk budget, and files that are not in the index
+    (orphans) are removed once they are older than `ORPHAN_GRACE_SECONDS`.
+
+    Attributes:
+
+        path(Path): Root directory of the cache.
+
+        budget_bytes(int): Disk budget, stored in the index so every process
+            uses the same.
+
+    Methods:
+
+        path_of: Location of the file of an entry.
+
+        lookup: Location of an entry, counting a hit or a miss.
+
+        latest: Most recent entry of a family, to update it instead of
+            computing it from scratch.
+
+        register: Adds a file just written at `path_of`.
+
+        evict: Removes orphans and the least recently used entries.
+
+        stats: Entries, bytes, hits and misses of each kind.
+
+        clear: Removes every entry.
+    """
+
+    SUFFIX = '.ftr'
+
+    def __init__(self, path: Path, budget_bytes: int = None):
+        self.path = Path(path)
+        if budget_bytes is None \
+                and self.path.joinpath('index.sqlite').is_file():
+            return
+        makedirs(self.path, exist_ok=True)
+
+        with closing(self._connect()) as connection, connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY, kind TEXT, family TEXT,
+                    bytes INTEGER, created REAL, last_used REAL,
+                    hits INTEGER DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS by_family
+                    ON entries (family, created);
+                CREATE TABLE IF NOT EXISTS stats (
+                    kind TEXT PRIMARY KEY,
+                    hits INTEGER DEFAULT 0, misses INTEGER DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS settings (
+                    name TEXT PRIMARY KEY, value
+                );
+            """)
+            if budget_bytes is not None:
+                connection.execute(
+                    "INSERT OR REPLACE INTO settings VALUES ('budget', ?)",
+                    (int(budget_bytes),)
+                )
+
+    def __getstate__(self):
+        # The index is opened again by each process.
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path.joinpath('index.sqlite'), timeout=60)
+
+    @property
+    def budget_bytes(self) -> int:
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT value FROM settings WHERE name = 'budget'"
+            ).fetchone()
+        return DEFAULT_BUDGET_BYTES if row is None else int(row[0])
+
+    def path_of(self, kind: str, key: str) -> Path:
+        """Location of the file of an entry, it may not exist."""
+        return self.path.joinpath(kind, f'{key}{self.SUFFIX}')
+
+    def lookup(self, kind: str, key: str) -> Optional[Path]:
+        """Location of the file of an entry, or None if it is not stored.
+        The hit or miss is counted, and a hit marks the entry as used.
+        """
+        path = self.path_of(kind, key)
+        hit = path.is_file()
+        now = time()
+
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO stats (kind) VALUES (?)", (kind,)
+            )
+            connection.execute(
+                f"UPDATE stats SET {'hits' if hit else 'misses'} = "
+                f"{'hits' if hit else 'misses'} + 1 WHERE kind = ?", (kind,)
+            )
+            if hit:
+                updated = connection.execute(
+                    "UPDATE entries SET last_used = ?, hits = hits + 1 "
+                    "WHERE key = ?", (now, key)
+                ).rowcount
+                if not updated:
+                    # A file written at its address is valid, it is adopted.
+                    connection.execute(
+                        "INSERT INTO entries VALUES (?, ?, NULL, ?, ?, ?, 1)",
+                        (key, kind, stat(path).st_size, now, now)
+                    )
+            else:
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+        return path if hit else None
+
+    def latest(self, kind: str, family: str) -> Optional[Path]:
+        """File of the last entry created in a family, or None."""
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT key FROM entries WHERE family = ? "
+                "ORDER BY created DESC", (family,)
+            ).fetchall()
+
+        for key, in rows:
+            path = self.path_of(kind, key)
+            if path.is_file():
+                return path
+
+        return None
+
+    def register(self, kind: str, key: str, family: str = None) -> Path:
+        """Adds to the index the file just written at `path_of(kind, key)`
+        and evicts other entries if the budget is exceeded.
+
+        Only the total of the index is read for each entry, the files are 
+        walked when the budget is exceeded or, to remove the orphans, once 
+        every `ORPHAN_SCAN_SECONDS`.
+        """
+        path = self.path_of(kind, key)
+        now = time()
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, "
+                "COALESCE((SELECT hits FROM entries WHERE key = ?), 0))",
+                (key, kind, family, stat(path).st_size, now, now, key)
+            )
+            total, = connection.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM entries"
+            ).fetchone()
+            settings = dict(connection.execute(
+                "SELECT name, value FROM settings"
+            ).fetchall())
+
+        budget_bytes = int(settings.get('budget', DEFAULT_BUDGET_BYTES))
+        scanned = float(settings.get('orphans_scanned', 0))
+        if total > budget_bytes or now - scanned > ORPHAN_SCAN_SECONDS:
+            self.evict(budget_bytes, keep=(key,))
+        return path
+
+    def _remove_orphans(
+        self,
+        keys: set,
+        grace_seconds: float = ORPHAN_GRACE_SECONDS
+    ) -> int:
+        freed = 0
+        now = time()
+        for kind_dir in scandir(self.path):
+            if not kind_dir.is_dir():
+                continue
+            for entry in scandir(kind_dir.path):
+                try:
+                    entry_stat = entry.stat()
+                    age = now - entry_stat.st_mtime
+                    if entry.name.endswith('.tmp'):
+                        orphan = age > STALE_TMP_SECONDS
+                    else:
+                        orphan = entry.name.endswith(self.SUFFIX) \
+                            and entry.name[:-len(self.SUFFIX)] not in keys \
+                            and age > grace_seconds
+                    if orphan:
+                        remove(entry.path)
+                        freed += entry_stat.st_size
+                except FileNotFoundError:
+                    # Removed by another process.
+                    continue
+        return freed
+
+    def evict(
+        self,
+        budget_bytes: int = None,
+        keep: Tuple[str, ...] = ()
+    ) -> int:
+        """Removes the files that are not in the index and then the least
+        recently used entries until the rest fit in the budget.
+
+        Args:
+            budget_bytes: Default is the budget of the cache.
+
+            keep: Keys that are not evicted.
+
+        Returns:
+            Bytes freed.
+        """
+        budget_bytes = self.budget_bytes if budget_bytes is None \
+            else budget_bytes
+
+        with closing(self._connect()) as connection, connection:
+            rows = connection.execute(
+                "SELECT key, kind, bytes FROM entries ORDER BY last_used"
+            ).fetchall()
+
+            freed = self._remove_orphans({key for key, _, _ in rows})
+            connection.execute(
+                "INSERT OR REPLACE INTO settings "
+                "VALUES ('orphans_scanned', ?)", (time(),)
+            )
+
+            total = sum(size for _, _, size in rows)
+            evicted = []
+            for key, kind, size in rows:
+                if total <= budget_bytes:
+                    break
+                if key in keep:
+                    continue
+                path = self.path_of(kind, key)
+                if path.is_file():
+                    remove(path)
+                    freed += size
+                total -= size
+                evicted.append((key,))
+
+            connection.executemany("DELETE FROM entries WHERE key = ?",
+                                   evicted)
+
+        return freed
+
+    def stats(self) -> pd.DataFrame:
+        """Number of entries, bytes on disk, hits, misses and hit ratio of
+        each kind of frame.
+        """
+        with closing(self._connect()) as connection:
+            df_entries = pd.read_sql_query(
+                "SELECT kind, COUNT(*) AS entries, SUM(bytes) AS bytes "
+                "FROM entries GROUP BY kind", connection, index_col='kind'
+            )
+            df_stats = pd.read_sql_query(
+                "SELECT kind, hits, misses FROM stats", connection,
+                index_col='kind'
+            )
+
+        df_stats = df_entries.join(df_stats, how='outer').fillna(0)\
+            .astype('int64')
+        lookups = df_stats['hits'] + df_stats['misses']
+        df_stats['hit_ratio'] = df_stats['hits'] / lookups.where(lookups > 0)
+
+        return df_stats
+
+    def clear(self) -> None:
+        """Removes every entry and its file. The stats are kept."""
+        with closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM entries")
+        self._remove_orphans(set(), grace_seconds=-1)
+
+
+class MemoryCache():
+    """Frames kept in memory by their key in the DerivedCache, shared by 
+    every object of the process, so a frame loaded once is not read and 
+    decoded again from its file.
+
+    The keys are content addressed, so an entry never becomes stale. The 
+    least recently used entries are dropped once the frames take more than 
+    the budget. Every `get` and `put` hands out a view of the frame (a 
+    shallow copy), so a hit does not copy the values; with Copy-on-Write a 
+    change to a view copies them first, so it never reaches the frame kept.
+
+    Attributes:
+
+        budget_bytes(int): Memory budget.
+
+    Methods:
+
+        get: Frame and extra object of a key, or None.
+
+        put: Adds a frame and returns a view of it.
+
+        resize: Changes the budget.
+
+        stats: Entries, bytes, hits and misses.
+
+        clear: Drops every entry.
+    """
+
+    def __init__(self, budget_bytes: int = DEFAULT_MEMORY_BYTES):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = Lock()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[Tuple[pd.DataFrame, Any]]:
+        """View of the frame of `key` and the object stored with it, or 
+        None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+
+        df, extra, _ = entry
+        return df.copy(deep=False), extra
+
+    def put(self, key: str, df: pd.DataFrame, extra: Any = None) -> pd.DataFrame:
+        """Keeps a frame (and any object that goes with it) and returns a 
+        view of it. The frame itself should not be used anymore.
+        """
+        size = int(df.memory_usage(deep=True).sum())
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[2]
+            if size <= self.budget_bytes:
+                self._entries[key] = (df, extra, size)
+                self._bytes += size
+            self._evict()
+
+        return df.copy(deep=False)
+
+    def _evict(self) -> None:
+        while self._bytes > self.budget_bytes:
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+
+    def resize(self, budget_bytes: int) -> None:
+        """Changes the budget, dropping entries if it is exceeded."""
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            self._evict()
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'budget_bytes': self.budget_bytes,
+            'hits': self._hits,
+            'misses': self._misses,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+# Shared by every StationsDataFrame and record of the process.
+memory_cache = MemoryCache()
@@ -2,24 +2,69 @@
 
 from datetime import date
 from pathlib import Path
-from xmlrpc.client import Boolean
-from ..utils.make_paths_dict import make_dict
-from ..utils.paths import is_valid
-
-
-# Define custom function for pathing.
-paths_dict = make_dict()
+from ..utils.make_paths_dict import get_dict
 
 import pandas as pd
 import numpy as np
-import regex as re
 
-from datetime import date
-from typing import List, Literal, Tuple
+from typing import (
+    Dict, Iterator, List, Optional, Sequence, Tuple, Union
+)
 from numpy import unique
-from shutil import rmtree
 from os import makedirs
-from ..utils.web import asyncronous_download_from_urls
+from warnings import warn
+from .aggregation import (
+    SKETCH_BINS,
+    DailyQuantileSketch,
+    daily_median,
+    gap_segments,
+    lag_frame,
+    period_codes,
+    period_starts,
+    periodic_medians,
+    sketch_median,
+    station_matrix,
+    station_source,
+    update_daily_median
+)
+from .cache import DerivedCache, MemoryCache, cache_key, memory_cache
+from .parsers import STATION_COLUMNS, read_stations_catalog
+from .pipeline import Pipeline, PlanSpec
+from .regions import RegionIndex
+from .spatial import GriddedField, IDWGrid, StationIndex
+from .storage import (
+    RAW_ENCODING,
+    DownloadManifest,
+    StationStore,
+    file_digest,
+    file_signature,
+    load_station,
+    load_stations,
+    read_archive,
+    read_signature,
+    station_batch,
+    write_archive,
+    write_frame
+)
+
+# The paths are only built when they are used, and the networking libraries 
+# are only imported by the functions that download, so importing this module 
+# stays cheap for short lived processes.
+
+def __getattr__(name: str):
+    # `paths_dict` is kept for compatibility.
+    if name == 'paths_dict':
+        return get_dict()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class _PathEntry():
+    """Class attribute with an entry of the dict of paths."""
+
+    def __init__(self, key: str):
+        self.key = key
+
+    def __get__(self, instance, owner):
+        return get_dict()[self.key]
 
 class StationsDataFrame(pd.DataFrame):
     """A subclass of DataFrame with the data of the climatic stations of the Mexican Republic, obtained from:
@@ -29,8 +74,15 @@ class StationsDataFrame(pd.DataFrame):
     
     Attributes:
 
-        path: Location where the feather version of the dataframe with the 
-            station data is located (or will be found).
+        path: Location of the feather version of the dataframe with the 
+            station data, in the cache.
+
+        cache(DerivedCache): Cache of the derived frames (catalog, daily 
+            and periodic medians). Its `stats` show the hits and misses.
+
+        memory_cache(MemoryCache): Frames already loaded by any object of 
+            the process, handed out as views that copy on write. Its 
+            budget is changed with `memory_cache.resize`.
 
 
     Methods:
@@ -41,88 +93,126 @@ class StationsDataFrame(pd.DataFrame):
 
         region_median(state=str, municipality=str): Generates a RegionMedian
             object with a data frame that contains the temporal median of all stations of selected region.  
-    """
 
-    _kmz_url = paths_dict['kmz_url']
-    _kmz_path =  paths_dict['kmz_path'] 
-    _kml_path = paths_dict['kml_path']  
-    path =  paths_dict['df_stations_path']
+        build_archive(state=str, municipality=str, by_year=bool): Writes the 
+            data of the stations of a region (or of all of them) into the 
+            partitioned parquet archive.
 
-    def __init__(
-        self, 
-        re_download: bool = False
-    ): 
-             
-        # Verify if the data frame is already created:
-        if not self.path.is_file() or re_download:
-            # Verify if the kml file exists.
-            if not self._kml_path.is_file() or re_download:
-                # Verify if kmz file exits.
-                if not self._kmz_path.is_file() or re_download:
-                    _download_kmz(self._kmz_url, self._kmz_path)
-                _kmz_to_kml(self._kmz_path, self._kml_path)
-        
-            kml_file = open(self._kml_path, "r", encoding='utf-8')
-            lines = kml_file.readlines() 
+        query_archive(state=str, municipality=str, numbers=list, 
+            date_interval=tuple, columns=list): Reads only the matching 
+            part of the archive.
 
-            # Regular expression to extract description tag.
-            r_stations = '^\s*<description><!\[CDATA\[<h3>' +\
-                        "(.*) - ([A-Z]{8,10})</h3><font color='red'><p><b>Estado : </b>"+ \
-                        '(.*)</p><p><b>Municipio : </b>' +\
-                        '(.*)</p><p><b>Organismo : </b>' +\
-                        '(.*)</p><p><b>Cuenca : </b>'+\
-                        '(.*)</p><p><a href=https://smn.conagua.gob.mx/tools/RESOURCES/Diarios/'+\
-                        '(.*).txt>Climatología diaria</a></p>.*</a></p>\]\]></description>$'
+        refresh_stations(state=str, municipality=str): Downloads only the new
+            days of the raw files of a region.
 
-            rs = re.compile(r_stations) 
+        build_store(state=str, municipality=str): Packs the stations of a 
+            region (or all of them) into the memory mapped StationStore.
 
-            # Regular expression to extract coordinates tag.
-            r_coordinates = '^\s*<coordinates>(.*),(.*),(.*)</coordinates>$'
-            rc = re.compile(r_coordinates) 
+        StationStore(): Opens the memory mapped store of stations.
 
-            # Search with both regular expresions line by line:
+        StationIndex(): Spatial index of the stations, for k-nearest, radius
+            and bounding box queries.
 
-            rows = []
-            for k, line in enumerate(lines):
-                if rs.match(line):
-                    rows.append(rs.search(line).groups() 
-                                + rc.search(lines[k+3]).groups())
+        GriddedField(column=str, date_interval=tuple, longitude=array, 
+            latitude=array): Interpolates a variable of the stations onto a 
+            lat/lon grid, stored as a memory mapped cube.
 
+        Pipeline(state=str, municipality=str): Lazy chain of daily medians, 
+            periodic medians and lags of a region, computed by `collect`.
+    """
 
-            # Creating the data frame.
-            cols = ['name', 'status', 'state', 'municipality', 'organization', 'basin', 
-                    'number', 'longitude', 'latitude', 'altitude']
-        
-        
-            df_stations = pd.DataFrame(rows, columns=cols)
+    _kmz_url = _PathEntry('kmz_url')
+    _kmz_path = _PathEntry('kmz_path')
+    _kml_path = _PathEntry('kml_path')
+    path = None
+    cache_path = _PathEntry('cache_dir')
+    cache = None
+    memory_cache: MemoryCache = memory_cache
+    archive_path = _PathEntry('archive_dir')
+    store_path = _PathEntry('store_dir')
+    _station_index = None
+    _region_index = None
+    _pipeline_cache = None
 
-            # Change names and types
-            df_stations = df_stations.astype({
-                'number':'int64','status':'category', 'longitude':'float64', 
-                'latitude':'float64', 'altitude':'float64'
-                })
-        
-            df_stations['status'] = df_stations['status']\
-                .cat\
-                .rename_categories({'OPERANDO':'working', 'SUSPENDIDA':'stopped'})
-        
+    def __init__(
+        self, 
+        re_download: bool = False,
+        cache_budget: int = None
+    ): 
+        """
+        Args:
+            re_download: Downloads the kmz file of the catalog again.
 
-            # Change index
-            df_stations = df_stations.set_index('number')
-            df_stations.sort_index()
+            cache_budget: Bytes of disk that the cache of derived frames can 
+                take, it is kept for the next uses. Default is the last 
+                budget given, or 10 GiB.
+        """
+        cache = DerivedCache(self.cache_path, cache_budget)
+        family = cache_key('catalog', {})
+
+        # An already extracted kml file is used if there is no kmz file.
+        catalog_path = self._kmz_path if self._kmz_path.is_file() \
+            else self._kml_path
+
+        # Without its source, the last catalog derived is used.
+        latest = None
+        if not catalog_path.is_file() and not re_download:
+            latest = cache.latest('catalog', family)
+
+        if re_download or (latest is None and not catalog_path.is_file()):
+            _download_kmz(self._kmz_url, self._kmz_path)
+            catalog_path = self._kmz_path
+
+        # Loaded before by this process, found by the signature of the source
+        # so it is not read again.
+        if latest is None:
+            memory_key = cache_key('catalog', {'source': str(catalog_path)}, 
+                                   file_signature(catalog_path))
+        else:
+            memory_key = latest.stem
+        cached = memory_cache.get(memory_key)
+
+        if cached is None:
+            key = latest.stem if latest is not None \
+                else cache_key('catalog', {}, file_digest(catalog_path))
+            path = cache.lookup('catalog', key)
+            if path is None:
+                if not catalog_path.is_file():
+                    # The last catalog was evicted meanwhile.
+                    _download_kmz(self._kmz_url, self._kmz_path)
+                    catalog_path = self._kmz_path
+                    key = cache_key('catalog', {}, file_digest(catalog_path))
+                    memory_key = cache_key(
+                        'catalog', {'source': str(catalog_path)}, 
+                        file_signature(catalog_path)
+                    )
 
-            # Export the data frame.
-            df_stations.reset_index().to_feather(self.path)
+                # Stream the placemarks straight out of the catalog.
+                df_stations = read_stations_catalog(catalog_path)
+                write_frame(df_stations.reset_index(), 
+                            cache.path_of('catalog', key))
+                path = cache.register('catalog', key, family)
 
-        # Load file.
-        df_stations = pd.read_feather(self.path)
-        df_stations = df_stations.set_index('number')
+            # Load file.
+            df_stations = pd.read_feather(path)
+            df_stations = df_stations.set_index('number')
+
+            # Lookups of the stations of each region and of each station.
+            region_index = RegionIndex(df_stations)
+            df_stations = memory_cache.put(memory_key, df_stations, 
+                                           (region_index, key))
+        else:
+            df_stations, (region_index, key) = cached
     
         super().__init__(df_stations)
 
+        self.path = cache.path_of('catalog', key)
+        self.cache = cache
+        self._region_index = region_index
+
 
     def _download_url_base(self, number:int):
-        return paths_dict['url_base'](number)
+        return get_dict()['url_base'](number)
 
 
     def _numbers_by_region(
@@ -131,13 +221,11 @@ class StationsDataFrame(pd.DataFrame):
         municipality: str = ""
     ) -> list:
 
-        # Query string
-        new_query = f"state == '{state.upper()}'"
-        if municipality:
-            new_query += f" and municipality == '{municipality.upper()}'"
-        
-        # Doing the query. 
-        return  self.query(new_query).index.to_list()
+        # Without state, the whole country.
+        if not state:
+            return self.index.to_list()
+
+        return self._region_index.numbers_of(state, municipality).tolist()
 
     def _download_files_by_numbers(
         self,
@@ -148,45 +236,255 @@ class StationsDataFrame(pd.DataFrame):
             f"The list of stations is empty, verify that you are making a query with valid names of states and/or municipalities within the Mexican Republic."
         ) 
 
-        download_dirs = [
-            self.station(number, define_empty=True).raw_path.parent for number in number_list
-        ]
+        raw_paths = {
+            number: self.Station(number, define_empty=True).raw_path 
+            for number in number_list
+        }
 
-        # Remove dirs
+        # Only the files that are missing, truncated or failed before are 
+        # downloaded, unless `re_download`.
+        manifest = DownloadManifest(get_dict()['manifest_path'])
         if re_download:
-            for dir in unique(download_dirs):
-                if dir.is_dir():
-                    rmtree(dir)
+            number_list = list(raw_paths)
+        else:
+            number_list = manifest.pending(raw_paths)
 
-        # Verify if dirs exists:
-        dirs_already_exist = []
+        download_dirs = [raw_paths[number].parent for number in number_list]
         for dir in unique(download_dirs):
-            if dir.is_dir():
-                dirs_already_exist.append(dir)
-            else:
-                makedirs(dir, exist_ok=True)
-
-        # Removing already downloaded files from list.        
-        if re_download == False:
-            to_pop = []
-            for k, download_dir in enumerate(download_dirs):
-                for already_downloaded_dir in dirs_already_exist:
-                    if download_dir == already_downloaded_dir:
-                        to_pop.append(k)
-            
-            number_list = [
-                number_list[k] for k in range(len(number_list)) if k not in to_pop
-            ]
-            download_dirs = [
-                download_dirs[k] for k in range(len(download_dirs)) 
-                if k not in to_pop
-            ]
+            makedirs(dir, exist_ok=True)
         
         # Url List
         urls = [self._download_url_base(number) for number in number_list]
+        numbers_by_url = dict(zip(urls, number_list))
+
+        def record(result):
+            number = numbers_by_url[result.url]
+            manifest.record(number, result.url, raw_paths[number], 
+                            result.ok, result.error)
 
-        #  Download files: 
-        asyncronous_download_from_urls(urls, download_dirs, encoding='cp1252')
+        from ..utils.web import asyncronous_download_from_urls
+
+        #  Download files, each one is recorded as soon as it finishes: 
+        results = asyncronous_download_from_urls(urls, download_dirs, 
+                                                 encoding=RAW_ENCODING,
+                                                 on_result=record)
+
+        # Report the stations that could not be downloaded.
+        failed = [
+            f'{number} ({result.error})' 
+            for number, result in zip(number_list, results) if not result.ok
+        ]
+        if failed:
+            warn(f"{len(failed)} stations could not be downloaded and will "
+                 f"be missing: {', '.join(failed)}")
+
+        return results
+
+    def refresh_stations(
+        self,
+        state: str = '',
+        municipality: str = '',
+        limit: int = 3
+    ) -> dict:
+        """Brings the raw files of the stations of a region (all the 
+        stations if there is no `state`) up to date, with conditional 
+        requests that only fetch the days appended since the last refresh.
+
+        Returns:
+            Dict with the outcome of each station number: `not_modified`, 
+            `appended`, `downloaded` or `failed`.
+        """
+        if state:
+            number_list = self._numbers_by_region(state, municipality)
+        else:
+            number_list = self.index.to_list()
+
+        download_dirs = [
+            self.Station(number, define_empty=True).raw_path.parent 
+            for number in number_list
+        ]
+        for dir in unique(download_dirs):
+            makedirs(dir, exist_ok=True)
+
+        urls = [self._download_url_base(number) for number in number_list]
+
+        from ..utils.web import incremental_download_from_urls
+        outcomes = incremental_download_from_urls(
+            urls, download_dirs, get_dict()['http_validators_path'], 
+            limit=limit, encoding=RAW_ENCODING
+        )
+
+        # Changed files are recorded in the manifest of downloads.
+        manifest = DownloadManifest(get_dict()['manifest_path'])
+        for number, url, dir in zip(number_list, urls, download_dirs):
+            if outcomes[url] in ('downloaded', 'appended'):
+                manifest.record(number, url, dir.joinpath(f'{number}.txt'))
+            elif outcomes[url] == 'failed':
+                manifest.record(number, url, None, ok=False)
+
+        return {
+            number: outcomes[url] for number, url in zip(number_list, urls)
+        }
+
+    def _station_paths(
+        self,
+        number_list: List[int]
+    ) -> Dict[int, Tuple[Path, Path]]:
+        """Pairs (raw path, cache path) of the stations whose raw file is 
+        available, by station number. Missing raw files are downloaded 
+        first, in this process.
+        """
+        stations = [
+            self.Station(number, define_empty=True) for number in number_list
+        ]
+
+        missing = [
+            station.number for station in stations 
+            if not station.raw_path.is_file()
+        ]
+        if missing:
+            self._download_files_by_numbers(missing)
+
+        return {
+            station.number: (station.raw_path, station.interim_path) 
+            for station in stations if station.raw_path.is_file()
+        }
+
+    def _station_frames(
+        self,
+        number_list: List[int],
+        workers: int = 1
+    ) -> List[pd.DataFrame]:
+        """Data frames of many stations, parsed by `workers` processes (all 
+        the CPUs if it is None).
+        """
+        return load_stations(
+            list(self._station_paths(number_list).values()), workers
+        )
+
+    def _iter_station_frames(
+        self,
+        number_list: List[int]
+    ) -> Iterator[pd.DataFrame]:
+        """Data frames of many stations, loaded one at a time."""
+        for raw_path, interim_path in self._station_paths(number_list).values():
+            yield load_station(raw_path, interim_path)
+
+    def daily_quantiles(
+        self,
+        state: str = '',
+        municipality: str = '',
+        quantiles: Tuple[float, ...] = (0.1, 0.5, 0.9),
+        bins: dict = SKETCH_BINS
+    ) -> pd.DataFrame:
+        """Daily quantiles of each column across the stations of a region 
+        (the whole country if there is no `state`).
+
+        The stations are read one at a time into a DailyQuantileSketch, so 
+        memory depends on the number of days and not on the number of 
+        stations. See its documentation for the error bound.
+
+        Returns:
+            DataFrame indexed by `date` with the columns 
+            `{column}_p{percent}`, for example `rainfall_p10`.
+        """
+        sketch = DailyQuantileSketch(bins)
+        for df_station in self._iter_station_frames(
+            self._numbers_by_region(state, municipality)
+        ):
+            sketch.update(df_station)
+
+        return sketch.quantiles(quantiles)
+
+    def all_daily_medians(
+        self,
+        regions: List[Tuple[str, str]] = None,
+        workers: int = 1,
+        overwrite: bool = False
+    ) -> Dict[Tuple[str, str], Path]:
+        """Calculates and stores the daily medians of many regions at once, 
+        in the same files that `DailyMedians` loads.
+
+        The regions are processed state by state: the stations of a state 
+        are loaded only once and grouped by municipality, so a station feeds 
+        its municipality and its state without being parsed twice, and only 
+        one state is in memory at a time.
+
+        Args:
+            regions: List of pairs (state, municipality), with an empty 
+                municipality for the whole state. Default is every state and 
+                every municipality of the catalog.
+
+            workers: Processes used to parse the station files.
+
+            overwrite: Calculates again the regions that already have a file.
+
+        Returns:
+            Dict with the path of the file of each region, with names in 
+            lower case.
+        """
+        if regions is None:
+            pairs = self[['state', 'municipality']].drop_duplicates()
+            regions = [(state, '') for state in pairs['state'].unique()] \
+                + list(pairs.itertuples(index=False, name=None))
+
+        regions = [
+            (state.lower(), municipality.lower()) 
+            for state, municipality in regions
+        ]
+        handles = {region: DailyMedians(self, *region) for region in regions}
+
+        regions_by_state = {}
+        for region in regions:
+            if overwrite or not handles[region].path.is_file():
+                regions_by_state.setdefault(region[0], []).append(region[1])
+
+        states = self['state'].str.lower()
+        municipalities = self['municipality'].str.lower()
+
+        for state, municipality_list in regions_by_state.items():
+            in_state = states == state
+            if '' not in municipality_list:
+                in_state &= municipalities.isin(municipality_list)
+
+            numbers = self.index[in_state].to_list()
+            station_paths = self._station_paths(numbers)
+            frames = dict(zip(
+                station_paths, 
+                load_stations(list(station_paths.values()), workers)
+            ))
+
+            sources = {
+                number: station_source(
+                    frames[number], read_signature(station_paths[number][1])
+                )[0]
+                for number in frames
+            }
+
+            for municipality in municipality_list:
+                if municipality:
+                    members = [
+                        number for number in frames 
+                        if municipalities[number] == municipality
+                    ]
+                else:
+                    members = list(frames)
+
+                handle = handles[(state, municipality)]
+                handle._address({
+                    number: station_paths[number][0] for number in members
+                })
+
+                df_all = daily_median([frames[number] for number in members])
+                df_all = df_all.interpolate(method='time')
+                write_medians(
+                    df_all, handle.path, 
+                    {str(number): sources[number] for number in members},
+                    base=handle.key
+                )
+                self.cache.register('daily', handle.key, handle.family)
+
+        return {region: handle.path for region, handle in handles.items()}
 
     def Station(
         self, 
@@ -206,7 +504,7 @@ class StationsDataFrame(pd.DataFrame):
 
             raw_path(Path): This is the location of the raw data on the hard drive, used to create the object. (If the file does not exist, it will be downloaded)
 
-            df(pandas,DataFrame): Here the information of each station is stored. Contains the columns 
+            df(pandas,DataFrame): Here the information of each station is stored, it is only read (and downloaded if needed) on first use. Contains the columns 
                 - `rainfall`: total daily rain in mm
                 - `evaporation`: total daily evaporation in mm.
                 - `min_t`: minimal temperature in °C.
@@ -214,12 +512,200 @@ class StationsDataFrame(pd.DataFrame):
 
         Methods:
 
+            release: Frees the df, it is read again on the next use.
+
+        """
+        return Station(self, number, define_empty)
+
+
+    def build_archive(
+        self,
+        state: str = '',
+        municipality: str = '',
+        by_year: bool = False
+    ) -> None:
+        """Writes the data of the stations of a region into the archive in 
+        `archive_path`, a parquet dataset partitioned by state and 
+        municipality (and year if `by_year`). Without a `state`, every 
+        station in the catalog is written. The partitions of the region are 
+        replaced, the others are left untouched.
+        """
+        if state:
+            numbers = sorted(self._numbers_by_region(state, municipality))
+        else:
+            numbers = self.index.sort_values().to_list()
+
+        def batches():
+            for number in numbers:
+                yield station_batch(
+                    self.Station(number).df, number, 
+                    self.at[number, 'state'], self.at[number, 'municipality'],
+                    by_year
+                )
+
+        write_archive(batches(), self.archive_path, by_year)
+
+    def query_archive(
+        self,
+        state: str = '',
+        municipality: str = '',
+        numbers: List[int] = None,
+        date_interval: Tuple[date, date] = None,
+        columns: List[str] = None
+    ) -> pd.DataFrame:
+        """Reads from the archive only the partitions and row groups that 
+        match the region, the list of station `numbers` and the 
+        `date_interval`, with only the selected `columns`. The result is 
+        indexed by `number` and `date`.
         """
-        return station(self, number, define_empty)
+        return read_archive(self.archive_path, state, municipality, numbers,
+                            date_interval, columns)
+
+    def build_store(
+        self,
+        state: str = '',
+        municipality: str = '',
+        dtype: str = 'float32'
+    ) -> StationStore:
+        """Packs the stations of a region, or of the whole catalog if there 
+        is no `state`, into the memory mapped store in `store_path`, 
+        replacing the previous one.
+        """
+        if state:
+            numbers = sorted(self._numbers_by_region(state, municipality))
+        else:
+            numbers = self.index.sort_values().to_list()
+
+        frames = ((number, self.Station(number).df) for number in numbers)
+
+        return StationStore.write(self.store_path, frames, dtype)
+
+    def StationStore(self) -> StationStore:
+        """Opens the memory mapped store built with `build_store`. The 
+        object can be sent to other processes, which map the same file.
+        """
+        return StationStore(self.store_path)
+
+    def StationIndex(self) -> StationIndex:
+        """Spatial index over the coordinates of the stations, built the 
+        first time it is requested. Its queries return station numbers that 
+        can be used with `Station` or `_station_frames`.
+        """
+        if self._station_index is None:
+            self._station_index = StationIndex.from_frame(self)
+
+        return self._station_index
+
+    def GriddedField(
+        self,
+        column: str,
+        date_interval: Tuple[date, date],
+        longitude: np.ndarray,
+        latitude: np.ndarray,
+        k: int = 8,
+        power: float = 2.,
+        max_distance_km: float = None,
+        path: Path = None,
+        workers: int = 1
+    ) -> GriddedField:
+        """Interpolates the daily values of a variable onto a regular lat/lon 
+        grid by inverse distance weighting of the `k` nearest stations.
+
+        Only the stations that are neighbours of some cell are loaded. If the 
+        field was already stored in `path` with the same axes and parameters, 
+        it is just opened.
+
+        Args:
+            column: Variable of the stations, for example `rainfall`.
+
+            date_interval: First and last date.
+
+            longitude: Longitudes of the columns of the grid.
+
+            latitude: Latitudes of the rows of the grid.
+
+            k: Maximum number of stations of each cell.
 
+            power: Power of the distance in the weights.
 
-    def DailyMedians(self, state, municipality=''):
+            max_distance_km: Stations further away from a cell are ignored.
+
+            path: Directory of the field. Default is one in `grids_dir` named 
+                after the column, the dates, the size of the grid and a key 
+                of the axes and the parameters.
+
+            workers: Processes used to parse the station files.
+
+        Returns:
+            GriddedField with a memory mapped cube (days × latitude × 
+            longitude).
+        """
+        start, end = (pd.Timestamp(limit).date() for limit in date_interval)
+        longitude = np.asarray(longitude, dtype='float64')
+        latitude = np.asarray(latitude, dtype='float64')
+        params = {
+            'column': column, 'start': str(start), 'end': str(end), 'k': k,
+            'power': power, 'max_distance_km': max_distance_km
+        }
+        if path is None:
+            key = cache_key('grid', params, [longitude.tolist(), 
+                                             latitude.tolist()])
+            path = get_dict()['grids_dir'].joinpath(
+                f'{column}-{start}-{end}-{len(latitude)}x{len(longitude)}-'
+                f'{key}'
+            )
+
+        if path.joinpath('grid.json').is_file():
+            field = GriddedField(path)
+            if field.matches(longitude, latitude, params):
+                return field
+
+        grid = IDWGrid(self.StationIndex(), longitude, latitude, k, power, 
+                       max_distance_km)
+
+        # Stations without a file are left as missing values.
+        station_paths = self._station_paths(grid.numbers.tolist())
+        frames = dict(zip(
+            station_paths, 
+            load_stations(list(station_paths.values()), workers)
+        ))
+
+        first, last = (
+            np.datetime64(limit, 'D').astype('i8') for limit in (start, end)
+        )
+        values = station_matrix(
+            [frames.get(number, pd.DataFrame({column: []}, 
+                                             index=pd.DatetimeIndex([])))
+             for number in grid.numbers], 
+            column, first, last
+        )
+
+        return GriddedField.write(path, grid, values, start, column)
+
+    def Pipeline(
+        self, 
+        state: str = '', 
+        municipality: str = '', 
+        workers: int = 1
+    ) -> Pipeline:
+        """Starts a lazy pipeline over the stations of a region (the whole 
+        country if there is no `state`). See `Pipeline` for its stages. 
+
+        The frames computed by the pipelines of this object are kept and 
+        reused by the next ones.
+        """
+        if self._pipeline_cache is None:
+            self._pipeline_cache = {}
+
+        return Pipeline(self, PlanSpec(state, municipality), 
+                        self._pipeline_cache, workers)
+
+    def DailyMedians(self, state, municipality='', workers=1, streaming=False):
         """Calculates the median of the day of each column with the data from all the stations in the given `state` and `municipality`.
+
+        The station files are parsed by `workers` processes, `None` uses all the CPUs.
+
+        With `streaming`, the stations are read one at a time into a DailyQuantileSketch and the median is estimated within half the width of its bins, with memory that does not depend on the number of stations (for national or multi-state regions). It is stored in its own file.
         
         Attributes:
             
@@ -229,13 +715,17 @@ class StationsDataFrame(pd.DataFrame):
 
             municipality(str): The municipality where the station is located.
 
-            df(pandas.DataFrame):  Here the data is stored. Columns:
+            df(pandas.DataFrame):  Here the data is stored, it is only read (or computed) on first use. Columns:
                 - `rainfall`: total daily rain in mm
                 - `evaporation`: total daily evaporation in mm.
                 - `min_t`: minimal temperature in °C.
                 - `max_t` maximal temperature in °C.
 
         Methods:
+
+            release: Frees the df, it is read again on the next use.
+
+            update: Recomputes only the days whose station data changed since the df was stored, optionally downloading the new data first.
             
             add_is_rainy_col: Generates a column of boolean values in the df. True when it is a rainy day and False when it is not.
 
@@ -247,320 +737,633 @@ class StationsDataFrame(pd.DataFrame):
 
             time_interval_trim: Generates a new DataFrame only with values between a time interval.
 
-            PeriodicMedians: Generates an new object with weekly or monthly median values.
+            PeriodicMedians: Generates an new object with daily, weekly, monthly, quarterly, yearly or N-day median values, stored in a file.
+
+            periodic_medians: Median values of many frequencies at once, without storing them.
         """
-        return daily_medians(self, state, municipality)
+        return DailyMedians(self, state, municipality, workers, streaming)
 
-def station(outer_self, number:int, define_empty=False):
-    class Station():
-        def __init__(self, number:int, define_empty = False):
-            """            
-            Parameters:
-            
-                number(int): It's the station number. You can look up this number on the object StationsDataFrame.
-                define_empty(bool)
-            """
-            # Region:
-            assert len(outer_self.index == number)!=0, "The station doesn't exists."                 
-            
-            self.number = number
-            self.state = str(outer_self['state'][
-                outer_self.index == number
-            ].to_list()[0].lower())
-            
-            self.municipality = str(outer_self['municipality'][
-                outer_self.index == number
-            ].to_list()[0].lower())              
-            
-            # Raw path:
-            def _raw_dir_base(state:str, municipality:str):    
-                return paths_dict['download_dir_base'](
-                    state, municipality
-                ) 
-            
-            def _interim_dir_base(state:str, municipality:str):    
-                return paths_dict['interim_dir_base'](
-                    state, municipality
-                ) 
-            
-            state = self.state.replace(" ", "_")
-            municipality = self.municipality.replace(" ", "_")        
-
-            self.raw_path = _raw_dir_base(state, municipality)\
-                .joinpath(f"{number}.txt")
-            self.interim_path = _interim_dir_base(state, municipality)\
-                .joinpath(f"{number}.txt")
-
-            if define_empty == False:
-                # Download files if requiered.        
-                if not self.raw_path.is_file():
-                    stations_in_same_region = \
-                        outer_self._numbers_by_region(
-                            self.state, self.municipality
-                        )
-                    outer_self._download_files_by_numbers(
-                        stations_in_same_region
-                    )
+class _LazyRecord():
+    """Base of the records of this module. They are light handles with the 
+    paths and the region of their data, the data frame is only loaded the 
+    first time `df` is used and `release` frees it. Only the `_fields` are 
+    pickled, so they are cheap to send to other processes.
+    """
+    __slots__ = ('_df', '_catalog')
+    _fields: Tuple[str, ...] = ()
 
-                
-                pattern = \
-                    "([\d]{2,2}/[\d]{2,2}/[\d]{4,4})\s+"\
-                    + "([\d.Nulo]+)\s+"\
-                    + "([\d.Nulo]+)\s+"\
-                    + "([\d.Nulo]+)\s+"\
-                    + "([\d.Nulo]+)\s+"
-                r_pattern = re.compile(pattern) 
-    
-                rows = []
-                with open(self.raw_path, 'r') as raw_file:
-                    for line in raw_file:
-                        if r_pattern.match(line):
-                            rows.append(r_pattern.search(line).groups())
-                    
-                
-                df_station = pd.DataFrame(
-                    rows, 
-                    columns=['date', 'rainfall','evaporation','max_t',
-                                'min_t'],
-                    )
-                
-                # Date as index.
-                df_station['date'] = pd.to_datetime(df_station['date'],
-                                                    format='%d/%m/%Y')
-                df_station = df_station.set_index('date')
-                
-                # Change al data frame to float.
-                df_station = df_station.replace('Nulo', np.nan)
-                df_station = df_station.astype(float)
+    def __getstate__(self):
+        return {field: getattr(self, field) for field in self._fields}
 
-            else:
-                df_station = pd.DataFrame()
-                
-            self.df =  df_station
+    def __setstate__(self, state):
+        for cls in type(self).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                setattr(self, slot, state.get(slot))
 
-    return Station(number, define_empty)
+    def __repr__(self):
+        fields = ', '.join(
+            f'{field}={getattr(self, field)!r}' for field in self._fields 
+            if not field.endswith('path')
+        )
+        return f'{type(self).__name__}({fields})'
 
-# Functions for interior classes:
+    @property
+    def catalog(self) -> 'StationsDataFrame':
+        """The StationsDataFrame, loaded again after unpickling."""
+        if self._catalog is None:
+            self._catalog = StationsDataFrame()
+        return self._catalog
 
-def daily_medians(outer_self, state, municipality=''):
-    class DailyMedians():
-        def __init__(self, state, municipality):
-            self.state = state
-            self.municipality = municipality
-
-            # Path:
-            def _path_base(state:str, municipality:str):    
-                return paths_dict['df_region_medians_dir_base'](
-                    state, municipality
-                ) 
-            
-            state_ = self.state.replace(" ", "_")
-            municipality_ = self.municipality.replace(" ", "_")        
+    @property
+    def df(self) -> pd.DataFrame:
+        if self._df is None:
+            self._df = self._load()
+        return self._df
 
-            self.path = _path_base(state_, municipality_)
+    @df.setter
+    def df(self, df: pd.DataFrame) -> None:
+        self._df = df
 
-            if not self.path.is_file():
+    @property
+    def is_loaded(self) -> bool:
+        return self._df is not None
 
-                
-                # Find all stations in same region.
-                stations_in_region = \
-                    outer_self._numbers_by_region(
-                        self.state, self.municipality
-                    )
+    def release(self) -> None:
+        """Frees the data frame, it is loaded again on the next use."""
+        self._df = None
 
-                df_all = None 
-                
-                # Join al stations in the region
-                for number in stations_in_region:
-                    df_station = outer_self.Station(number).df
+    def _load(self) -> pd.DataFrame:
+        raise NotImplementedError
 
-                    if df_all is None: 
-                        df_all = df_station.copy(deep=True)
-                    else:
-                        df_all = pd.concat([df_all, df_station], axis=0)                
 
-                # Calculate median.
-                df_all = df_all.groupby('date').median().reset_index()
-                
-                # Set index  
-                df_all = df_all.set_index('date')
+class Station(_LazyRecord):
+    """A climatic station of the catalog.
 
-                # Remove empty values by interpolation.
-                df_all = df_all.interpolate(method='time')
+    Attributes:
 
-                # Export
-                df_all.reset_index().to_feather(self.path)
+        number(int): It's the station number. You can look up this number on 
+            the object StationsDataFrame.
 
-            else:
-                df_all = pd.read_feather(self.path)
-                df_all = df_all.set_index('date')
+        state(str): State where the station is located, in lower case.
+
+        municipality(str): Municipality where the station is located.
 
-            self.df = df_all
+        raw_path(Path): Location of the downloaded `{number}.txt` file.
+
+        interim_path(Path): Location of the parsed feather cache.
+
+        df(pandas.DataFrame): Data of the station, the raw files of its 
+            region are downloaded if they are missing. It is read on first 
+            use.
+    """
+    __slots__ = ('number', 'state', 'municipality', 'raw_path', 'interim_path')
+    _fields = __slots__
+
+    def __init__(
+        self, 
+        stations: 'StationsDataFrame', 
+        number: int, 
+        define_empty: bool = False
+    ):
+        # Region:
+        assert number in stations._region_index, "The station doesn't exists."                 
         
-        def add_is_rainy_col(self):
-            '''Generates in-place `is_rainy` column with boolean values in the df. True when it is a rainy day and False when it is not.            
-            '''
-            # Empty col.
-            self.df['is_rainy'] = False
-            # True values
-            self.df.loc[self.df['rainfall'] >= 2.5, 'is_rainy'] = True
-
-        def add_month_number_col(self):
-            '''Generates in-place `month` with month numbers.          
-            '''
-            self.df['month'] = self.df.index.month.tolist()
+        self._catalog = stations
+        self.number = number
+        state, municipality = stations._region_index.region_of(number)
+        self.state = str(state).lower()
+        self.municipality = str(municipality).lower()
         
-        def add_day_of_year_col(self):
-            '''Generates in-place `day_of_year` with the number of the day of the year (1-366).          
-            '''
+        # Paths:
+        state = self.state.replace(" ", "_")
+        municipality = self.municipality.replace(" ", "_")        
 
-            self.df['day_of_year'] = self.df.index.dayofyear
+        self.raw_path = get_dict()['download_dir_base'](state, municipality)\
+            .joinpath(f"{number}.txt")
+        self.interim_path = get_dict()['interim_dir_base'](state, municipality)\
+            .joinpath(f"{number}.ftr")
 
-        def interpolate(self):
-            self.df = self.df.interpolate(method='time')
+        # With `define_empty` only the paths are needed.
+        self._df = pd.DataFrame() if define_empty else None
 
-        def time_interval_trim(self, date_interval:Tuple[date,date]):
-            
-            if date_interval[0]:                 
-                mask = (self.df.index>=str(date_interval[0]))
+    def _load(self) -> pd.DataFrame:
+        # Download files if requiered.        
+        if not self.raw_path.is_file():
+            self.catalog._download_files_by_numbers(
+                self.catalog._numbers_by_region(self.state, self.municipality)
+            )
+
+        # Parsed data is cached in the interim path, it is only parsed
+        # again if the raw file changes.
+        return load_station(self.raw_path, self.interim_path)
+
+
+# Functions for interior classes:
+
+def daily_key(
+    state: str,
+    municipality: str,
+    streaming: bool,
+    raw_paths: Dict[int, Path]
+) -> Tuple[str, str]:
+    """Keys in the DerivedCache of the daily medians of a region and of 
+    their family, from the size and time of the raw files of its stations.
+    """
+    params = {
+        'state': state.lower(), 
+        'municipality': municipality.lower(), 
+        'streaming': streaming
+    }
+    inputs = {
+        str(number): [signature['size'], signature['mtime_ns']]
+        for number, signature in (
+            (number, file_signature(raw_path)) 
+            for number, raw_path in raw_paths.items()
+        )
+    }
+    return cache_key('daily', params, inputs), cache_key('daily', params)
+
+def write_medians(
+    df_all: pd.DataFrame,
+    path: Path,
+    stations: Dict[str, dict],
+    changes: List[List[int]] = None,
+    base: str = None
+) -> None:
+    """Stores the daily medians of a region with the description of the 
+    stations they come from and the days changed by each update, so they can 
+    be updated incrementally. `base` is the key of the medians whose updates 
+    are counted in `changes`.
+    """
+    if changes is None:
+        # Computed at once, as a single change of every day.
+        days = df_all.index.values.astype('datetime64[D]').astype('i8')
+        changes = [[int(days.min()), int(days.max())]] if len(days) else []
+
+    write_frame(df_all.reset_index(), path, 
+                {'changes': changes, 'stations': stations, 'base': base})
+
+class DailyMedians(_LazyRecord):
+    """Median of the day of each column across the stations of a region, 
+    see `StationsDataFrame.DailyMedians`. The df is read, or computed and 
+    stored, on first use.
+
+    It is stored in the DerivedCache with a key of the region and of the 
+    raw files of its stations; when they change, the last medians of the 
+    region (its family) are updated instead of computed from scratch.
+    """
+    __slots__ = ('state', 'municipality', 'workers', 'streaming', 'key', 
+                 'family', 'path', '_meta')
+    _fields = ('state', 'municipality', 'workers', 'streaming', 'key', 
+               'family', 'path')
+
+    def __init__(
+        self, 
+        stations: 'StationsDataFrame', 
+        state: str, 
+        municipality: str = '', 
+        workers: int = 1, 
+        streaming: bool = False
+    ):
+        self._catalog = stations
+        self._df = None
+        self._meta = None
+        self.state = state
+        self.municipality = municipality
+        self.workers = workers
+        self.streaming = streaming
+
+        # Path, from the raw files already downloaded:
+        members = (
+            stations.Station(number, define_empty=True) 
+            for number in stations._numbers_by_region(state, municipality)
+        )
+        self._address({
+            station.number: station.raw_path for station in members 
+            if station.raw_path.is_file()
+        })
+
+    def _address(self, raw_paths: Dict[int, Path]) -> None:
+        self.key, self.family = daily_key(self.state, self.municipality, 
+                                          self.streaming, raw_paths)
+        self.path = self.catalog.cache.path_of('daily', self.key)
+
+    def _load(self) -> pd.DataFrame:
+        cached = memory_cache.get(self.key)
+        if cached is not None:
+            df_all, meta = cached
+            self._meta = dict(meta)
+            return df_all
+
+        cache = self.catalog.cache
+        if cache.lookup('daily', self.key) is None:
+            # Built as an update of the last medians of the region, or of 
+            # an empty data frame.
+            seed = cache.latest('daily', self.family)
+            if seed is None:
+                self._df = daily_median([])
+                self._meta = {'changes': [], 'stations': {}, 
+                              'base': self.key}
             else:
-                mask = (self.df.index == self.df.index)
+                self._df = pd.read_feather(seed).set_index('date')
+                self._meta = read_signature(seed) or {}
+            self.update()
+            return self._df
 
-            if date_interval[1]:
-                mask &= (self.df.index<=str(date_interval[1]))
+        df_all = pd.read_feather(self.path).set_index('date')
+        return memory_cache.put(self.key, df_all, dict(self._signature()))
 
-            return self.df[mask]
-            
+    def _signature(self) -> dict:
+        """Sources of the df and its updates. Files stored before do not 
+        have them and are computed again on the first update.
+        """
+        if self._meta is None:
+            if self.path.is_file():
+                self._meta = read_signature(self.path) or {}
+            else:
+                self.df
+        return self._meta
 
-        def PeriodicMedians(
-            self, 
-            frequency: Literal["W", "M"], 
-            date_interval: Tuple[date,date] = None
-        ): 
+    @property
+    def changes(self) -> List[List[int]]:
+        """First and last day changed by each update."""
+        return self._signature().get('changes', [])
 
-            return interval_medians(self, frequency, date_interval)
-    
-    return DailyMedians(state, municipality)
+    @changes.setter
+    def changes(self, changes: List[List[int]]) -> None:
+        self._signature()['changes'] = changes
 
+    @property
+    def stations(self) -> Dict[str, dict]:
+        """Description of each station used, by number."""
+        return self._signature().get('stations', {})
 
+    @stations.setter
+    def stations(self, stations: Dict[str, dict]) -> None:
+        self._signature()['stations'] = stations
 
-from datetime import timedelta
-def interval_medians(outer_self, 
-    frequency: Literal["W", "M"], 
-    date_interval: Tuple[date,date] = None
-):
+    @property
+    def revision(self) -> int:
+        """Number of updates of the stored data frame."""
+        return len(self.changes)
 
-    class PeriodicMedians():
-        def __init__(
-            self, 
-            frequency: Literal["W", "M"], 
-            date_interval: Tuple[date,date] = None
-        ) -> None:
-            path_base = paths_dict['df_interval_dir_base']
+    def update(
+        self, 
+        refresh: bool = False, 
+        limit: int = 3
+    ) -> Optional[Tuple[date, date]]:
+        """Brings the stored df up to date with the data of the stations. 
 
-            self.frequency = frequency
-            self.date_interval = date_interval
-        
-            self.path = path_base(outer_self.state, 
-                                outer_self.municipality, frequency,
-                                str(self.date_interval[0]), 
-                                str(self.date_interval[1]))
-
-            if not self.path.is_file():
-                outer_self.interpolate()
-
-                outer_self.add_is_rainy_col()
-                
-                if self.frequency == 'W': # Weekly
-                    outer_self.add_day_of_year_col()
-                    key = 'day_of_year'
-                else: # 'Monthly
-                    outer_self.add_month_number_col()
-                    key = 'month'
-
-                if self.date_interval:
-                    df_trimmed = outer_self.time_interval_trim(self.date_interval)
-                else:
-                    df_trimmed = outer_self.df.copy()
-                
-                data_dict = {}
-                
-                for col in df_trimmed.columns:
-                    if col == 'is_rainy': # Sum of total rainfall in the 
-                                        # interval
-                        data_dict[col] = df_trimmed[col]\
-                            .groupby(pd.PeriodIndex(
-                                df_trimmed[col].index,freq=self.frequency))\
-                            .sum()
-                    else: # median for every else.
-                        data_dict[col] =df_trimmed[col]\
-                            .groupby(pd.PeriodIndex(
-                                df_trimmed[col].index,freq=self.frequency))\
-                            .median()
-
-                # Creation of data frame.
-                df_interval = pd.DataFrame(data_dict)
-
-                # Types.
-                df_interval[key] = df_interval[key].astype(int)
-                df_interval.index = df_interval.index.to_timestamp()
-
-                # Change one column name.
-                names = df_interval.columns.tolist()
-                names[names.index('is_rainy')] = 'rainy_days'
-                df_interval.columns = names
-
-                df_interval.reset_index().to_feather(self.path)
+        Only the days whose values changed in some station (new days 
+        appended, a corrected history, stations added or removed) are 
+        computed again, and the result is the same as computing the 
+        whole history.
 
-            else:
-                df_interval = pd.read_feather(self.path)
-                df_interval = df_interval.set_index('date')
+        Args:
+            refresh: Downloads first the new data of the stations of the 
+                region with `refresh_stations`.
 
-            self.df = df_interval
+            limit: Simultaneous downloads when `refresh`.
 
-        def _gaps(self):
-            deltas = self.df.index.to_series().diff()[1:]
-            gaps = deltas[deltas > timedelta(days=31)]
+        Returns:
+            The first and last dates that changed, or None if the df was 
+            already up to date.
+        """
+        if refresh:
+            self.catalog.refresh_stations(
+                self.state, self.municipality, limit
+            )
+
+        # Find all stations in same region.
+        station_paths = self.catalog._station_paths(
+            self.catalog._numbers_by_region(self.state, self.municipality)
+        )
+        self._address({
+            number: raw_path for number, (raw_path, _) in station_paths.items()
+        })
+
+        # Nothing to read if no raw file changed since the last update.
+        unchanged = self.path.is_file() \
+            and self.stations.keys() == set(map(str, station_paths)) \
+            and all(
+                file_signature(raw_path).items() 
+                <= self.stations[str(number)].items()
+                for number, (raw_path, _) in station_paths.items()
+            )
+        if unchanged:
+            return None
+
+        if self.streaming:
+            # One station at a time, read again if the window grows.
+            def frames():
+                return (
+                    load_station(*paths) 
+                    for paths in station_paths.values()
+                )
+            median = sketch_median
+        else:
+            loaded = load_stations(
+                list(station_paths.values()), self.workers
+            )
+            def frames():
+                return loaded
+            median = daily_median
+
+        # Days changed in each station.
+        stations = {}
+        spans = []
+        for number, df_station in zip(station_paths, frames()):
+            key = str(number)
+            stations[key], span = station_source(
+                df_station, read_signature(station_paths[number][1]), 
+                self.stations.get(key)
+            )
+            if span is not None:
+                spans.append(span)
+
+        for key in self.stations.keys() - stations.keys():
+            if self.stations[key]['first'] is not None:
+                spans.append((self.stations[key]['first'], 
+                              self.stations[key]['last']))
+
+        if not spans:
+            # Only the times of the files changed.
+            self.stations = stations
+            self.df = self._write(self.df[STATION_COLUMNS])
+            return None
+
+        spans = np.array(spans)
+        bounds = [
+            (description['first'], description['last']) 
+            for description in stations.values() 
+            if description['first'] is not None
+        ] or [(spans[:, 0].min(), spans[:, 1].max())]
+        bounds = np.array(bounds)
+
+        df_all, first, last = update_daily_median(
+            self.df[STATION_COLUMNS], frames, 
+            int(spans[:, 0].min()), int(spans[:, 1].max()), 
+            (int(bounds[:, 0].min()), int(bounds[:, 1].max())), 
+            median
+        )
+
+        self.changes = self.changes + [[first, last]]
+        self.stations = stations
+        self.df = self._write(df_all)
+
+        return (
+            np.datetime64(first, 'D').item(), 
+            np.datetime64(last, 'D').item()
+        )
+
+    def _write(self, df_all: pd.DataFrame) -> pd.DataFrame:
+        """Stores the df and returns a view of the frame kept in memory."""
+        self._signature().setdefault('base', self.key)
+        write_medians(df_all, self.path, self.stations, self.changes, 
+                      self._signature()['base'])
+        self.catalog.cache.register('daily', self.key, self.family)
+        return memory_cache.put(self.key, df_all, dict(self._signature()))
+
+    def add_is_rainy_col(self):
+        '''Generates in-place `is_rainy` column with boolean values in the df. True when it is a rainy day and False when it is not.            
+        '''
+        # Empty col.
+        self.df['is_rainy'] = False
+        # True values
+        self.df.loc[self.df['rainfall'] >= 2.5, 'is_rainy'] = True
+
+    def add_month_number_col(self):
+        '''Generates in-place `month` with month numbers.          
+        '''
+        self.df['month'] = self.df.index.month.tolist()
+
+    def add_day_of_year_col(self):
+        '''Generates in-place `day_of_year` with the number of the day of the year (1-366).          
+        '''
+
+        self.df['day_of_year'] = self.df.index.dayofyear
+
+    def interpolate(self):
+        self.df = self.df.interpolate(method='time')
+
+    def time_interval_trim(self, date_interval:Tuple[date,date]):
+
+        if date_interval[0]:                 
+            mask = (self.df.index>=str(date_interval[0]))
+        else:
+            mask = (self.df.index == self.df.index)
+
+        if date_interval[1]:
+            mask &= (self.df.index<=str(date_interval[1]))
+
+        return self.df[mask]
+
+
+    def PeriodicMedians(
+        self, 
+        frequency: Union[str, int], 
+        date_interval: Tuple[date,date] = None
+    ): 
 
-            gaps = gaps.index.to_list()
-            gaps.insert(0,self.df.index.to_list()[0])
-            gaps.append(self.df.index.to_list()[-1])
+        return PeriodicMedians(self, frequency, date_interval)
 
-            return gaps
+    def periodic_medians(
+        self,
+        frequencies: Sequence[Union[str, int]] = ('W', 'M'),
+        date_interval: Tuple[date,date] = None
+    ) -> Dict[Union[str, int], pd.DataFrame]:
+        """Medians of many frequencies (`D`, `W`, `M`, `Q`, `Y` or 
+        windows of N days as `'10D'`) in one call, with the columns of 
+        PeriodicMedians. The df is not changed.
+        """
+        if date_interval:
+            df_trimmed = self.time_interval_trim(date_interval)
+        else:
+            df_trimmed = self.df
 
-       
+        return periodic_medians(df_trimmed[STATION_COLUMNS], frequencies)
 
-        def skip_with_gaps(self, independent_vars=['rainfall', 'rainy_days'], n=1):
-            df_skipped = None
-            gaps = self._gaps()
-            for k in range(len(gaps)-1):
 
-                mask = (self.df.index >= gaps[k]) & (self.df.index < gaps[k+1])
+class PeriodicMedians(_LazyRecord):
+    """Medians of a DailyMedians by period, see 
+    `DailyMedians.PeriodicMedians`. The df is read, or computed and stored, 
+    on first use.
 
-                df_interval = self.df[mask]
-                df_interval = skip(df_interval, independent_vars, n)
+    It is stored in the DerivedCache with a key of its parameters and of 
+    the key of the daily medians. When the daily medians change, the last 
+    periodic medians computed from the same daily medians (its family) are 
+    updated instead of computed from scratch.
+    """
+    __slots__ = ('daily', 'frequency', 'date_interval', 'revision')
+    _fields = __slots__
 
-                if df_skipped is None:
-                    df_skipped = df_interval.copy()
-                else:
-                    df_skipped = pd.concat([df_skipped, df_interval], axis=0)
+    def __init__(
+        self, 
+        daily: DailyMedians,
+        frequency: Union[str, int], 
+        date_interval: Tuple[date,date] = None
+    ) -> None:
+        self._catalog = None
+        self._df = None
+        self.daily = daily
+        self.frequency = frequency
+        self.date_interval = date_interval
+        self.revision = None
+
+    @property
+    def catalog(self) -> 'StationsDataFrame':
+        return self.daily.catalog
+
+    def _params(self) -> dict:
+        return {
+            'frequency': str(self.frequency), 
+            'date_interval': [str(day) for day in self.date_interval or []], 
+            'daily': self.daily.family
+        }
+
+    @property
+    def key(self) -> str:
+        """Key in the DerivedCache, it changes with the daily medians."""
+        return cache_key('periodic', self._params(), self.daily.key)
+
+    @property
+    def family(self) -> str:
+        # The revisions are only comparable between updates of the same 
+        # daily medians.
+        return cache_key('periodic', self._params() 
+                         | {'base': self.daily._signature().get('base')})
+
+    @property
+    def path(self) -> Path:
+        return self.catalog.cache.path_of('periodic', self.key)
+
+    def _load(self) -> pd.DataFrame:
+        cached = memory_cache.get(self.key)
+        if cached is not None:
+            df_interval, self.revision = cached
+            return df_interval
+
+        cache = self.catalog.cache
+        path = cache.lookup('periodic', self.key)
+        if path is not None:
+            df_interval = pd.read_feather(path).set_index('date')
+            self.revision = (read_signature(path) or {}).get('revision', 0)
+            return memory_cache.put(self.key, df_interval, self.revision)
+
+        seed = cache.latest('periodic', self.family)
+        if seed is None:
+            # The daily medians are not changed.
+            self._df = periodic_medians(
+                self._daily()[STATION_COLUMNS], [self.frequency]
+            )[self.frequency]
+            self.revision = self.daily.revision
+            self._write()
+            return self._df
+
+        self._df = pd.read_feather(seed).set_index('date')
+        self.revision = (read_signature(seed) or {}).get('revision', 0)
+
+        # The daily medians were updated after the last one was stored.
+        if self.revision < self.daily.revision:
+            self.update()
+        else:
+            self._write()
+
+        return self._df
+
+    def _write(self) -> None:
+        write_frame(self._df.reset_index(), self.path, 
+                    {'revision': self.revision})
+        self.catalog.cache.register('periodic', self.key, self.family)
+        self._df = memory_cache.put(self.key, self._df, self.revision)
+
+    def update(self) -> None:
+        """Computes again only the periods that contain days changed by 
+        the updates of the daily medians since the df was stored.
+        """
+        # Loading the df brings it up to date if it is stale.
+        self.df
+        changes = np.array(self.daily.changes[self.revision:])
+        self.revision = self.daily.revision
+        if not changes.size:
+            return
+
+        # Whole periods with changed days.
+        codes = period_codes(
+            np.array([changes[:, 0].min(), changes[:, 1].max()]), 
+            self.frequency
+        )
+        first, last, end = pd.DatetimeIndex(
+            period_starts(np.r_[codes, codes[1] + 1], self.frequency)
+            .astype('datetime64[D]').astype('datetime64[ns]')
+        )
+
+        df_window = self._daily()
+        df_window = df_window[
+            (df_window.index >= first) & (df_window.index < end)
+        ]
 
-            return df_skipped
+        # The same calendar columns that the stored df.
+        keys = [
+            key for key in ('day_of_year', 'month') 
+            if key in self.df.columns
+        ]
+        df_periods = periodic_medians(
+            df_window[STATION_COLUMNS], [self.frequency], keys=keys
+        )[self.frequency]
+
+        self.df = pd.concat([
+            self.df[self.df.index < first],
+            df_periods[self.df.columns],
+            self.df[self.df.index > last]
+        ])
+
+        self._write()
+
+    def _daily(self) -> pd.DataFrame:
+        """Daily medians inside the date interval."""
+        if self.date_interval:
+            return self.daily.time_interval_trim(self.date_interval)
+
+        return self.daily.df
+
+    def skip_with_gaps(self, independent_vars=['rainfall', 'rainy_days'], n=1):
+        """Lags `n` periods, or each number of periods of a list, every 
+        column but the `independent_vars`, without crossing the gaps of more 
+        than 31 days between periods. See `lag_frame` for the columns. The 
+        last period is left out.
+        """
+        df = self.df.iloc[:-1]
+        return lag_frame(df, independent_vars, n, gap_segments(df.index))
 
 
-                
-    return PeriodicMedians(frequency, date_interval)
+# Kept for compatibility, the records are built directly.
+
+def station(outer_self, number:int, define_empty=False):
+    return Station(outer_self, number, define_empty)
+
+def daily_medians(outer_self, state, municipality='', workers=1, 
+                  streaming=False):
+    return DailyMedians(outer_self, state, municipality, workers, streaming)
+
+def interval_medians(outer_self, 
+    frequency: Union[str, int], 
+    date_interval: Tuple[date,date] = None
+):
+    return PeriodicMedians(outer_self, frequency, date_interval)
                   
       
 
 
-
 # Download kmz file.
-import requests
 def _download_kmz(
-    kmz_url = paths_dict['kmz_url'],
-    kmz_path =  paths_dict['kmz_path']
+    kmz_url = None,
+    kmz_path = None
 ) -> None:
+    import requests
+
+    kmz_url = kmz_url or get_dict()['kmz_url']
+    kmz_path = kmz_path or get_dict()['kmz_path']
     headers = {'user-agent':'Mozilla/5.0 (Windows NT 6.1; Win64; x64; rv:47.0) Gecko/20100101 Firefox/47.3'}
     
     response = requests.get(kmz_url, verify=False, headers=headers )
@@ -570,51 +1373,12 @@ def _download_kmz(
     print(f'{kmz_url} has been downloaded.')
 
 
-from zipfile import ZipFile
-from shutil import copy, rmtree
-
-def _kmz_to_kml(
-    kmz_path = paths_dict['kmz_path'],
-    kml_path = paths_dict['kml_path']
-) -> None:
-
-    unzip_path = paths_dict['unzip_path']
-    # Unzip 
-    with ZipFile(kmz_path, 'r') as zip_ref:
-        zip_ref.extractall(unzip_path)
-
-    
-    # Copy only the kml file.
-    kml_origin = unzip_path.joinpath('doc.kml')
-    copy(kml_origin, kml_path)
-
-    # Delete irrelevant files.
-    rmtree(unzip_path)
-
-    print('The kmz file has been converted to kml')
-
-
-
 def skip(df, independent_vars=['rainfall', 'rainy_days'], n=1):
     """
-    function to skip one column on the dataframe
+    function to skip one column on the dataframe, see `lag_frame`. `df` is 
+    not changed.
     """
-        # Copy independent columns.
-    for column in independent_vars:
-       df.insert(0, f'{column}_copy',df[column].copy(), True)
-
-    # Finding  dependant variables.
-    columns = df.columns.to_list()
-    dependet_vars = [column for column in columns if column not in independent_vars]
-
-    # Skiping dependant vars.
-    df_x = df[dependet_vars].iloc[:-n]
-    df_x.index =df[dependet_vars].index[n:]  
-
-    # Skiping independent vars.
-    df_y = df[independent_vars].iloc[n:]
-    
-    return pd.concat([df_x, df_y], axis=1)
+    return lag_frame(df, independent_vars, n)
 
 
 def run():
@@ -0,0 +1,331 @@
+import re
+from io import StringIO
+from pathlib import Path
+from timeit import repeat
+from typing import Dict, Iterator, Tuple
+from xml.etree.ElementTree import iterparse
+from zipfile import ZipFile, is_zipfile
+
+import numpy as np
+import pandas as pd
+
+
+STATION_COLUMNS = ['rainfall', 'evaporation', 'max_t', 'min_t']
+NULL_VALUE = 'Nulo'
+
+# Start of a data row in the CONAGUA daily files (dd/mm/yyyy).
+_r_date_line = re.compile(r'^\d{2}/\d{2}/\d{4}', re.MULTILINE)
+
+
+def _station_body(text: str) -> str:
+    """Returns the block of `text` that goes from the first to the last data
+    row, leaving out the header and the footer of the file.
+    """
+    first = _r_date_line.search(text)
+    if first is None:
+        return ''
+
+    # The footer is only a few lines long, so it is walked backwards.
+    body = text[first.start():].rstrip()
+    while body:
+        start = body.rfind('\n') + 1
+        if _r_date_line.match(body, start):
+            break
+        body = body[:max(start - 1, 0)].rstrip()
+
+    return body
+
+
+def _parse_dates(dates: np.ndarray) -> pd.DatetimeIndex:
+    """Converts an array of `dd/mm/yyyy` strings into a DatetimeIndex with
+    integer arithmetic over the digits, much faster than `strptime`. Strings
+    that are not a valid date (like `31/02/1970`) are NaT.
+    """
+    dates = np.asarray(dates, dtype='U10')
+    characters = dates.view(np.uint32).reshape(-1, 10).astype(np.int64)
+    digits = characters - ord('0')
+
+    day = digits[:, 0] * 10 + digits[:, 1]
+    month = digits[:, 3] * 10 + digits[:, 4]
+    year = digits[:, 6] * 1000 + digits[:, 7] * 100 \
+        + digits[:, 8] * 10 + digits[:, 9]
+
+    is_digit = (digits >= 0) & (digits <= 9)
+    valid = is_digit[:, [0, 1, 3, 4, 6, 7, 8, 9]].all(axis=1) \
+        & (characters[:, 2] == ord('/')) & (characters[:, 5] == ord('/')) \
+        & (month >= 1) & (month <= 12) & (day >= 1)
+    month = np.where(valid, month, 1)
+
+    month_start = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    month_days = ((month_start + 1).astype('datetime64[D]')
+                  - month_start.astype('datetime64[D]')).astype(np.int64)
+    valid &= day <= month_days
+
+    values = month_start.astype('datetime64[D]') + (day - 1)
+    values[~valid] = np.datetime64('NaT')
+
+    return pd.DatetimeIndex(values.astype('datetime64[ns]'), name='date')
+
+
+def _empty_station_frame() -> pd.DataFrame:
+    return pd.DataFrame(
+        {column: pd.Series(dtype='float64') for column in STATION_COLUMNS},
+        index=pd.DatetimeIndex([], name='date'),
+    )
+
+
+def parse_station_text(text: str) -> pd.DataFrame:
+    """Parses the content of a CONAGUA daily station file in a single pass.
+
+    The body of the file is handed to the C parser of pandas, that reads the
+    values directly as floats, with `Nulo` treated as the missing value. If 
+    some row is short or has a value that is not a number, the values are 
+    read again as text and, like the line by line parser, those rows are 
+    left out, as well as the rows with an invalid date.
+
+    Args:
+        text: Content of the `{number}.txt` file.
+
+    Returns:
+        DataFrame indexed by `date` with the float columns `rainfall`,
+        `evaporation`, `max_t` and `min_t`.
+    """
+    body = _station_body(text)
+    if not body:
+        return _empty_station_frame()
+
+    def read(dtype):
+        return pd.read_csv(
+            StringIO(body),
+            sep=r'\s+',
+            header=None,
+            names=['date'] + STATION_COLUMNS,
+            usecols=range(len(STATION_COLUMNS) + 1),
+            dtype={'date': str} | {column: dtype for column in STATION_COLUMNS},
+            na_values=[NULL_VALUE],
+            keep_default_na=False,
+            engine='c',
+        )
+
+    try:
+        df_station = read('float64')
+        valid = np.ones(len(df_station), dtype=bool)
+    except ValueError:
+        try:
+            df_raw = read(str)
+        except pd.errors.ParserError:
+            # Every row is short.
+            return _empty_station_frame()
+        df_station = df_raw.copy()
+        valid = np.ones(len(df_station), dtype=bool)
+        for column in STATION_COLUMNS:
+            df_station[column] = pd.to_numeric(df_raw[column], 
+                                               errors='coerce')\
+                .astype('float64')
+            # Missing fields are empty, `Nulo` is already NaN.
+            valid &= (df_station[column].notna() | df_raw[column].isna())\
+                .to_numpy()
+
+    # Date as index.
+    df_station.index = _parse_dates(df_station.pop('date').to_numpy(str))
+    valid &= df_station.index.notna()
+
+    return df_station if valid.all() else df_station[valid]
+
+
+def read_station_file(path: Path, encoding: str = None) -> pd.DataFrame:
+    """Reads a CONAGUA daily station file with `parse_station_text`.
+
+    Args:
+        path: Location of the `{number}.txt` file.
+
+        encoding: Encoding of the file. Default is the one of the platform,
+            the same used when the file was downloaded.
+
+    Returns:
+        DataFrame indexed by `date` with the station columns.
+    """
+    with open(path, 'r', encoding=encoding) as raw_file:
+        return parse_station_text(raw_file.read())
+
+
+def parse_station_text_regex(text: str) -> pd.DataFrame:
+    """Line by line parser of a CONAGUA daily station file, based on regular
+    expressions. It is kept as reference for `benchmark_station_parsers`.
+    """
+    pattern = \
+        r"([\d]{2,2}/[\d]{2,2}/[\d]{4,4})\s+"\
+        + r"([\d.Nulo]+)\s+"\
+        + r"([\d.Nulo]+)\s+"\
+        + r"([\d.Nulo]+)\s+"\
+        + r"([\d.Nulo]+)\s+"
+    r_pattern = re.compile(pattern)
+
+    rows = []
+    for line in text.splitlines(keepends=True):
+        if r_pattern.match(line):
+            rows.append(r_pattern.search(line).groups())
+
+    df_station = pd.DataFrame(rows, columns=['date'] + STATION_COLUMNS)
+
+    # Date as index.
+    df_station['date'] = pd.to_datetime(df_station['date'], format='%d/%m/%Y')
+    df_station = df_station.set_index('date')
+
+    # Change al data frame to float.
+    df_station = df_station.replace(NULL_VALUE, np.nan)
+    df_station = df_station.astype(float)
+
+    return df_station
+
+
+def benchmark_station_parsers(
+    path: Path,
+    number: int = 5,
+    encoding: str = None
+) -> Dict[str, float]:
+    """Compares the time that the bulk and the regular expression parsers
+    take to read the same station file.
+
+    Args:
+        path: Location of a `{number}.txt` station file.
+
+        number: Times that each parser is run. The best time is reported.
+
+        encoding: Encoding of the file.
+
+    Returns:
+        Dict with the best time in seconds of each parser (`bulk` and `regex`)
+        and the `speedup` of the bulk parser.
+    """
+    with open(path, 'r', encoding=encoding) as raw_file:
+        text = raw_file.read()
+
+    times = {
+        'bulk': min(repeat(lambda: parse_station_text(text),
+                           number=1, repeat=number)),
+        'regex': min(repeat(lambda: parse_station_text_regex(text),
+                            number=1, repeat=number)),
+    }
+    times['speedup'] = times['regex'] / times['bulk']
+
+    return times
+
+
+CATALOG_COLUMNS = ['name', 'status', 'state', 'municipality', 'organization',
+                   'basin', 'number', 'longitude', 'latitude', 'altitude']
+
+# Regular expression to extract the fields of the description tag.
+_r_description = re.compile(
+    "<h3>(.*) - ([A-Z]{8,10})</h3><font color='red'><p><b>Estado : </b>"
+    + '(.*)</p><p><b>Municipio : </b>'
+    + '(.*)</p><p><b>Organismo : </b>'
+    + '(.*)</p><p><b>Cuenca : </b>'
+    + '(.*)</p><p><a href=https://smn.conagua.gob.mx/tools/RESOURCES/Diarios/'
+    + '(.*).txt>Climatología diaria</a></p>',
+    re.DOTALL
+)
+
+
+def _local_tag(element) -> str:
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def _open_kml(path: Path):
+    """Opens the KML document, directly from the zip member when `path` is a
+    KMZ file, without extracting it to disk.
+    """
+    if not is_zipfile(path):
+        return open(path, 'rb')
+
+    with ZipFile(path, 'r') as zip_ref:
+        names = zip_ref.namelist()
+        member = 'doc.kml' if 'doc.kml' in names else \
+            next(name for name in names if name.endswith('.kml'))
+        # The member keeps its own reference to the archive file.
+        return zip_ref.open(member)
+
+
+def iter_placemarks(path: Path) -> Iterator[Tuple[str, ...]]:
+    """Streams the stations of the CONAGUA catalog, one placemark at a time.
+
+    The document is read with `iterparse` and every placemark is released as
+    soon as it has been processed, so memory does not grow with the size of
+    the catalog and the layout of the lines of the file does not matter.
+
+    Args:
+        path: Location of the KMZ file (or of an already extracted KML).
+
+    Yields:
+        Tuples with the string values of `CATALOG_COLUMNS`.
+    """
+    with _open_kml(path) as kml_file:
+        # Open elements, the last one is the parent of the current element.
+        parents = []
+        for event, element in iterparse(kml_file, events=('start', 'end')):
+            if event == 'start':
+                parents.append(element)
+                continue
+
+            parents.pop()
+            if _local_tag(element) != 'Placemark':
+                continue
+
+            description = coordinates = None
+            for child in element.iter():
+                tag = _local_tag(child)
+                if tag == 'description':
+                    description = child.text
+                elif tag == 'coordinates':
+                    coordinates = child.text
+
+            match = _r_description.search(description or '')
+            # Detached from the document, so the tree does not grow.
+            element.clear()
+            if parents:
+                parents[-1].remove(element)
+
+            if match is None or coordinates is None:
+                continue
+
+            yield match.groups() \
+                + tuple(coordinates.strip().split(',')[:3])
+
+
+def read_stations_catalog(path: Path) -> pd.DataFrame:
+    """Builds the data frame of the climatic stations from the catalog.
+
+    Args:
+        path: Location of the KMZ file (or of an already extracted KML).
+
+    Returns:
+        DataFrame indexed by station `number`, with the columns of
+        `CATALOG_COLUMNS`.
+    """
+    df_stations = pd.DataFrame(iter_placemarks(path), columns=CATALOG_COLUMNS)
+
+    # Change names and types
+    df_stations = df_stations.astype({
+        'number':'int64','status':'category', 'longitude':'float64',
+        'latitude':'float64', 'altitude':'float64'
+        })
+
+    df_stations['status'] = df_stations['status']\
+        .cat\
+        .rename_categories({'OPERANDO':'working', 'SUSPENDIDA':'stopped'})
+
+    # Change index
+    return df_stations.set_index('number')
+
+
+def _run():
+    from sys import argv
+
+    for path in argv[1:]:
+        times = benchmark_station_parsers(Path(path))
+        print(f"{path}: bulk {times['bulk']:0.4f} s, "
+              f"regex {times['regex']:0.4f} s, "
+              f"speedup x{times['speedup']:0.1f}")
+
+if __name__ == '__main__':
+    _run()
@@ -0,0 +1,329 @@
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .aggregation import (
+    _days,
+    daily_median,
+    gap_segments,
+    lag_frame,
+    periodic_medians,
+    update_daily_median
+)
+from .cache import memory_cache
+from .parsers import STATION_COLUMNS
+from .storage import load_stations
+
+
+class PlanSpec(NamedTuple):
+    """Logical description of a pipeline, what is asked and not how."""
+    state: str = ''
+    municipality: str = ''
+    start: Optional[date] = None
+    end: Optional[date] = None
+    columns: Tuple[str, ...] = tuple(STATION_COLUMNS)
+    frequency: Optional[Union[str, int]] = None
+    lags: Optional[Union[int, Tuple[int, ...]]] = None
+    independent_vars: Tuple[str, ...] = ('rainfall', 'rainy_days')
+
+
+def _as_date(value) -> Optional[date]:
+    return None if value is None else pd.Timestamp(value).date()
+
+
+def _day(value: date) -> int:
+    return int(np.datetime64(value, 'D').astype('i8'))
+
+
+class Pipeline():
+    """Lazy chain of the stages region -> daily medians -> periodic medians
+    -> lagged frame. The methods only record what is asked; the work is done
+    by `collect`, which chooses the cheapest way to get it:
+
+        - A periodic or daily frame already loaded by the process or stored
+          on disk is used instead of being computed, and of a daily file
+          only the selected columns are read.
+
+        - Frames computed before by any pipeline of the same
+          StationsDataFrame are reused, also for a narrower range of dates or
+          fewer columns.
+
+        - When the stations have to be read, only the selected columns are
+          loaded and only the days needed for the date range (and for the
+          interpolation at its borders) are aggregated.
+
+    Example:
+
+        sdf.Pipeline('durango').dates('1980', '2000').select(['rainfall'])\\
+            .periodic('M').lag(1).collect()
+
+    Methods:
+
+        dates: Keeps only a range of dates.
+
+        select: Keeps only some of the station columns.
+
+        periodic: Medians by period, with a frequency of `periodic_medians`.
+
+        lag: Lags the dependent variables, see `PeriodicMedians.skip_with_gaps`.
+
+        explain: Description of the stages that `collect` would run.
+
+        collect: Computes the frame.
+    """
+
+    def __init__(
+        self,
+        stations,
+        spec: PlanSpec = PlanSpec(),
+        cache: Dict[tuple, List[tuple]] = None,
+        workers: int = 1
+    ):
+        self._stations = stations
+        self.spec = spec
+        self._cache = {} if cache is None else cache
+        self.workers = workers
+
+    def _replace(self, **fields) -> 'Pipeline':
+        return Pipeline(self._stations, self.spec._replace(**fields),
+                        self._cache, self.workers)
+
+    def __repr__(self):
+        return f'Pipeline({self.spec})'
+
+    # Logical plan.
+
+    def dates(self, start=None, end=None) -> 'Pipeline':
+        """Keeps only the dates from `start` to `end`, both included."""
+        return self._replace(start=_as_date(start), end=_as_date(end))
+
+    def select(self, columns: Sequence[str]) -> 'Pipeline':
+        """Keeps only some of the columns of the stations."""
+        unknown = set(columns) - set(STATION_COLUMNS)
+        assert not unknown, f"Unknown columns {unknown}."
+        return self._replace(columns=tuple(columns))
+
+    def periodic(self, frequency: Union[str, int]) -> 'Pipeline':
+        """Medians by period (`D`, `W`, `M`, `Q`, `Y` or N days)."""
+        return self._replace(frequency=frequency)
+
+    def lag(
+        self,
+        n: Union[int, Sequence[int]] = 1,
+        independent_vars: Sequence[str] = ('rainfall', 'rainy_days')
+    ) -> 'Pipeline':
+        """Lags `n` periods, or each number of periods of a list, every 
+        column but the `independent_vars`.
+        """
+        assert self.spec.frequency is not None, \
+            "The lags are taken over periodic medians, call `periodic` first."
+        return self._replace(lags=n if np.isscalar(n) else tuple(n),
+                             independent_vars=tuple(independent_vars))
+
+    # Physical plan.
+
+    def _daily_handle(self):
+        return self._stations.DailyMedians(self.spec.state,
+                                           self.spec.municipality)
+
+    def _periodic_handle(self):
+        spec = self.spec
+        date_interval = (spec.start, spec.end) \
+            if spec.start or spec.end else None
+        return self._daily_handle().PeriodicMedians(spec.frequency,
+                                                    date_interval)
+
+    def _daily_columns(self) -> List[str]:
+        columns = list(self.spec.columns)
+        # The rainy days of the periods come from the rainfall.
+        if self.spec.frequency is not None and 'rainfall' not in columns:
+            columns.append('rainfall')
+        return columns
+
+    def _cached_daily(self, columns: List[str]) -> Optional[pd.DataFrame]:
+        """A daily frame computed before that covers the dates and columns."""
+        spec = self.spec
+        for first, last, cached_columns, df_daily in self._cache.get(
+            ('daily', spec.state, spec.municipality), []
+        ):
+            covers = set(columns) <= set(cached_columns) \
+                and (first is None or (spec.start or date.min) >= first) \
+                and (last is None or (spec.end or date.max) <= last)
+            if covers:
+                return df_daily
+        return None
+
+    def _daily_source(self) -> str:
+        if self._cached_daily(self._daily_columns()) is not None \
+                or self._daily_handle().key in memory_cache:
+            return 'memory'
+        if self._daily_handle().path.is_file():
+            return 'disk'
+        return 'stations'
+
+    def _periodic_source(self) -> str:
+        if self._periodic_key() in self._cache \
+                or self._periodic_handle().key in memory_cache:
+            return 'memory'
+        if self._periodic_handle().path.is_file():
+            return 'disk'
+        return 'daily'
+
+    def _periodic_key(self) -> tuple:
+        spec = self.spec
+        return ('periodic', spec.state, spec.municipality, spec.start,
+                spec.end, spec.frequency, tuple(self._daily_columns()))
+
+    def explain(self) -> str:
+        """Stages that `collect` would run, from the last one."""
+        spec = self.spec
+        lines = []
+        if spec.lags is not None:
+            lines.append(f'lag n={spec.lags} '
+                         f'independent={list(spec.independent_vars)}')
+
+        daily_needed = True
+        if spec.frequency is not None:
+            source = self._periodic_source()
+            if source == 'disk':
+                source += f' {self._periodic_handle().path.name}'
+            lines.append(f'periodic {spec.frequency} [{source}]')
+            daily_needed = source == 'daily'
+
+        if daily_needed:
+            source = self._daily_source()
+            if source == 'disk':
+                source += f' {self._daily_handle().path.name}'
+            lines.append(
+                f'daily {spec.state or "all"}/{spec.municipality or "all"} '
+                f'{spec.start or "..."}:{spec.end or "..."} '
+                f'columns={self._daily_columns()} [{source}]'
+            )
+
+        return '\n'.join(
+            '  ' * depth + line for depth, line in enumerate(lines)
+        )
+
+    def _trim(self, df: pd.DataFrame) -> pd.DataFrame:
+        spec = self.spec
+        mask = np.ones(len(df), dtype=bool)
+        if spec.start:
+            mask &= df.index >= pd.Timestamp(spec.start)
+        if spec.end:
+            mask &= df.index <= pd.Timestamp(spec.end)
+        return df[mask]
+
+    def _collect_daily(self) -> pd.DataFrame:
+        spec = self.spec
+        columns = self._daily_columns()
+        key = ('daily', spec.state, spec.municipality)
+
+        df_daily = self._cached_daily(columns)
+        if df_daily is not None:
+            return self._trim(df_daily)[columns]
+
+        handle = self._daily_handle()
+        cached = memory_cache.get(handle.key)
+        if cached is not None:
+            df_daily = cached[0]
+            self._cache.setdefault(key, []).append(
+                (None, None, tuple(df_daily.columns), df_daily)
+            )
+            return self._trim(df_daily)[columns]
+
+        path = self._stations.cache.lookup('daily', handle.key)
+        if path is not None:
+            # The whole history is stored, only the columns are read.
+            df_daily = pd.read_feather(path, columns=['date'] + columns)\
+                .set_index('date')
+            self._cache.setdefault(key, []).append(
+                (None, None, tuple(columns), df_daily)
+            )
+            return self._trim(df_daily)
+
+        df_daily = self._daily_from_stations(columns)
+        self._cache.setdefault(key, []).append(
+            (spec.start, spec.end, tuple(columns), df_daily)
+        )
+        return df_daily
+
+    def _daily_from_stations(self, columns: List[str]) -> pd.DataFrame:
+        """Daily medians of the date range computed from the stations, the
+        same values as in the medians of the whole history.
+        """
+        spec = self.spec
+        station_paths = self._stations._station_paths(
+            self._stations._numbers_by_region(spec.state, spec.municipality)
+        )
+        frames = [
+            df_station for df_station in load_stations(
+                list(station_paths.values()), self.workers, columns
+            ) if len(df_station)
+        ]
+
+        df_empty = daily_median([], columns)
+        if not frames:
+            return df_empty
+
+        bounds = (
+            min(int(_days(df_station.index).min()) for df_station in frames),
+            max(int(_days(df_station.index).max()) for df_station in frames)
+        )
+        first = _day(spec.start) if spec.start else bounds[0]
+        last = _day(spec.end) if spec.end else bounds[1]
+        if first > last:
+            return df_empty
+
+        df_daily, _, _ = update_daily_median(
+            df_empty, lambda: frames, first, last, bounds,
+            lambda window: daily_median(window, columns)
+        )
+
+        return self._trim(df_daily)
+
+    def _collect_periodic(self) -> pd.DataFrame:
+        spec = self.spec
+        key = self._periodic_key()
+        if key in self._cache:
+            return self._cache[key]
+
+        handle = self._periodic_handle()
+        if handle.key in memory_cache or handle.path.is_file():
+            df_periodic = handle.df
+        else:
+            df_periodic = periodic_medians(
+                self._collect_daily(), [spec.frequency],
+                columns=self._daily_columns()
+            )[spec.frequency]
+
+        self._cache[key] = df_periodic
+        return df_periodic
+
+    def collect(self) -> pd.DataFrame:
+        """Runs the pipeline.
+
+        Returns:
+            The daily medians, or the periodic medians when there is a
+            frequency, with the selected columns and dates (the calendar and
+            `rainy_days` columns are kept in the periodic medians).
+        """
+        spec = self.spec
+        if spec.frequency is None:
+            return self._collect_daily()[list(spec.columns)]
+
+        df_periodic = self._collect_periodic()
+        dropped = [
+            column for column in STATION_COLUMNS
+            if column not in spec.columns and column in df_periodic.columns
+        ]
+        df_periodic = df_periodic.drop(columns=dropped)
+
+        if spec.lags is None:
+            return df_periodic
+
+        # The lags of the periods, as PeriodicMedians does it.
+        df_periodic = df_periodic.iloc[:-1]
+        return lag_frame(df_periodic, spec.independent_vars, spec.lags,
+                         gap_segments(df_periodic.index))
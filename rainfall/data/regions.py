@@ -0,0 +1,65 @@
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class RegionIndex():
+    """Lookup tables of the catalog of stations, built in one pass so that
+    finding the stations of a region or the region of a station does not
+    scan the catalog.
+
+    Names are compared in upper case, as they are in the catalog.
+
+    Attributes:
+
+        numbers(np.ndarray): Station numbers, in the order of the rows.
+
+        positions(dict): Station number -> row position.
+
+    Methods:
+
+        numbers_of: Array with the stations of a state or a municipality.
+
+        region_of: State and municipality of a station.
+    """
+
+    def __init__(self, df_stations: pd.DataFrame):
+        self.numbers = df_stations.index.to_numpy()
+        self.positions: Dict[int, int] = {
+            number: position for position, number in enumerate(self.numbers)
+        }
+
+        self._states = df_stations['state'].to_numpy()
+        self._municipalities = df_stations['municipality'].to_numpy()
+
+        # Rows of each municipality and of each whole state, in the order of
+        # the catalog.
+        self._members: Dict[Tuple[str, str], np.ndarray] = {
+            (state, ''): self.numbers[rows]
+            for state, rows in df_stations.groupby('state', sort=False)
+            .indices.items()
+        }
+        self._members.update({
+            key: self.numbers[rows]
+            for key, rows in df_stations.groupby(['state', 'municipality'],
+                                                 sort=False).indices.items()
+        })
+
+        self._empty = self.numbers[:0]
+
+    def __contains__(self, number: int) -> bool:
+        return number in self.positions
+
+    def numbers_of(self, state: str, municipality: str = '') -> np.ndarray:
+        """Station numbers of a municipality, or of a whole state if there is
+        no `municipality`. Unknown regions give an empty array.
+        """
+        return self._members.get(
+            (state.upper(), municipality.upper()), self._empty
+        )
+
+    def region_of(self, number: int) -> Tuple[str, str]:
+        """State and municipality of a station, as in the catalog."""
+        position = self.positions[number]
+        return self._states[position], self._municipalities[position]
@@ -0,0 +1,431 @@
+import json
+from datetime import date, timedelta
+from os import makedirs, replace
+from pathlib import Path
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+
+# Mean radius of the Earth.
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(
+    longitude_1: np.ndarray,
+    latitude_1: np.ndarray,
+    longitude_2: np.ndarray,
+    latitude_2: np.ndarray
+) -> np.ndarray:
+    """Great circle distance in km between points given in degrees."""
+    longitude_1, latitude_1, longitude_2, latitude_2 = map(
+        np.radians, (longitude_1, latitude_1, longitude_2, latitude_2)
+    )
+    a = np.sin((latitude_2 - latitude_1) / 2) ** 2 \
+        + np.cos(latitude_1) * np.cos(latitude_2) \
+        * np.sin((longitude_2 - longitude_1) / 2) ** 2
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class StationIndex():
+    """Spatial index of the stations, built once over the catalog.
+
+    The nearest neighbours and radius queries use a BallTree of scikit-learn
+    with the haversine metric, and the bounding boxes a binary search over
+    the stations sorted by latitude, so no query scans the whole catalog.
+
+    Attributes:
+
+        numbers(np.ndarray): Station numbers, in the order of the index.
+
+        longitude(np.ndarray): Longitude of each station in degrees.
+
+        latitude(np.ndarray): Latitude of each station in degrees.
+
+    Methods:
+
+        nearest: The k stations closest to a point.
+
+        within: The stations within a distance of a point.
+
+        bbox: The stations inside a bounding box.
+    """
+
+    def __init__(
+        self,
+        numbers: np.ndarray,
+        longitude: np.ndarray,
+        latitude: np.ndarray
+    ):
+        # Only needed to build the index.
+        from sklearn.neighbors import BallTree
+
+        self.numbers = np.asarray(numbers, dtype=np.int64)
+        self.longitude = np.asarray(longitude, dtype='float64')
+        self.latitude = np.asarray(latitude, dtype='float64')
+
+        self._tree = BallTree(
+            np.radians(np.column_stack([self.latitude, self.longitude])),
+            metric='haversine'
+        )
+
+        self._by_latitude = np.argsort(self.latitude, kind='stable')
+        self._sorted_latitude = self.latitude[self._by_latitude]
+
+    @classmethod
+    def from_frame(cls, df_stations: pd.DataFrame) -> 'StationIndex':
+        """Index of a catalog indexed by station number, with `longitude`
+        and `latitude` columns. Stations without coordinates are left out.
+        """
+        located = df_stations[['longitude', 'latitude']].notna().all(axis=1)
+        df_located = df_stations[located]
+
+        return cls(df_located.index.to_numpy(),
+                   df_located['longitude'].to_numpy(),
+                   df_located['latitude'].to_numpy())
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def nearest(
+        self,
+        longitude: float,
+        latitude: float,
+        k: int = 1,
+        return_distance: bool = False
+    ) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        """The `k` stations closest to a point, from the nearest.
+
+        Args:
+            longitude, latitude: The point in degrees.
+
+            k: Number of stations, at most the size of the index.
+
+            return_distance: Also returns the distances in km.
+
+        Returns:
+            Array of station numbers, and the array of distances if
+            `return_distance`.
+        """
+        distances, positions = self._tree.query(
+            np.radians([[latitude, longitude]]), k=min(k, len(self))
+        )
+        numbers = self.numbers[positions[0]]
+
+        if return_distance:
+            return numbers, distances[0] * EARTH_RADIUS_KM
+
+        return numbers
+
+    def within(
+        self,
+        longitude: float,
+        latitude: float,
+        radius_km: float,
+        return_distance: bool = False
+    ) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        """The stations at most `radius_km` away from a point, from the
+        nearest.
+
+        Args:
+            longitude, latitude: The point in degrees.
+
+            radius_km: Distance along the surface of the Earth.
+
+            return_distance: Also returns the distances in km.
+
+        Returns:
+            Array of station numbers, and the array of distances if
+            `return_distance`.
+        """
+        positions, distances = self._tree.query_radius(
+            np.radians([[latitude, longitude]]),
+            r=radius_km / EARTH_RADIUS_KM,
+            return_distance=True,
+            sort_results=True
+        )
+        numbers = self.numbers[positions[0]]
+
+        if return_distance:
+            return numbers, distances[0] * EARTH_RADIUS_KM
+
+        return numbers
+
+    def bbox(
+        self,
+        min_longitude: float,
+        min_latitude: float,
+        max_longitude: float,
+        max_latitude: float
+    ) -> np.ndarray:
+        """The stations inside a bounding box, limits included, sorted by
+        latitude.
+        """
+        start = np.searchsorted(self._sorted_latitude, min_latitude,
+                                side='left')
+        end = np.searchsorted(self._sorted_latitude, max_latitude,
+                              side='right')
+
+        positions = self._by_latitude[start:end]
+        longitude = self.longitude[positions]
+
+        return self.numbers[
+            positions[(longitude >= min_longitude)
+                      & (longitude <= max_longitude)]
+        ]
+
+
+# Distance from which a station is taken as placed on the cell, to avoid an 
+# infinite weight.
+MIN_DISTANCE_KM = 1e-3
+
+
+class IDWGrid():
+    """Inverse distance weighting of station values onto a regular lat/lon 
+    grid.
+
+    The `k` nearest stations of every cell and their weights 
+    `1 / distance ** power` are found once, when the grid is built, and kept 
+    as a sparse matrix (cells × stations). Interpolating is then a product of 
+    that matrix with the values of all the days at once; the weights are 
+    normalized on each day only over the stations with data.
+
+    Attributes:
+
+        longitude(np.ndarray): Longitudes of the columns of the grid.
+
+        latitude(np.ndarray): Latitudes of the rows of the grid.
+
+        numbers(np.ndarray): Stations used by at least one cell, the rows 
+            expected by `interpolate`.
+
+        k(int): Maximum number of stations of each cell.
+
+        power(float): Power of the distance in the weights.
+
+        max_distance_km(float): Stations further away from a cell are 
+            ignored, None if there is no limit.
+
+    Methods:
+
+        interpolate: Cube (days × latitude × longitude) from the values of 
+            the stations.
+    """
+
+    def __init__(
+        self,
+        index: StationIndex,
+        longitude: np.ndarray,
+        latitude: np.ndarray,
+        k: int = 8,
+        power: float = 2.,
+        max_distance_km: float = None
+    ):
+        from scipy.sparse import csr_matrix
+
+        self.longitude = np.asarray(longitude, dtype='float64')
+        self.latitude = np.asarray(latitude, dtype='float64')
+        self.k = k
+        self.power = power
+        self.max_distance_km = max_distance_km
+        neighbours = min(k, len(index))
+
+        # Cells in the order of the cube, latitude first.
+        cell_latitude, cell_longitude = np.meshgrid(
+            self.latitude, self.longitude, indexing='ij'
+        )
+        distances, positions = index._tree.query(
+            np.radians(np.column_stack([cell_latitude.ravel(), 
+                                        cell_longitude.ravel()])),
+            k=neighbours
+        )
+        distances = np.maximum(distances * EARTH_RADIUS_KM, MIN_DISTANCE_KM)
+
+        weights = distances ** -power
+        if max_distance_km is not None:
+            weights[distances > max_distance_km] = 0.
+
+        # Only the stations that contribute to some cell.
+        used, columns = np.unique(positions[weights > 0], return_inverse=True)
+        self.numbers = index.numbers[used]
+
+        rows = np.repeat(np.arange(len(positions)), neighbours)
+        self._weights = csr_matrix(
+            (weights[weights > 0], 
+             (rows[weights.ravel() > 0], columns.ravel())),
+            shape=(len(positions), len(used))
+        )
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.latitude), len(self.longitude)
+
+    def interpolate(
+        self,
+        values: np.ndarray,
+        out: np.ndarray = None,
+        chunk: int = 366
+    ) -> np.ndarray:
+        """Interpolates the values of every day onto the grid.
+
+        Args:
+            values: Array (stations × days) with the rows of `numbers`, NaN 
+                where a station has no data.
+
+            out: Array (days × latitude × longitude) where the result is 
+                written, for example a memory mapped file. Default is a new 
+                float32 array.
+
+            chunk: Days computed at a time, it bounds the memory used.
+
+        Returns:
+            The cube, NaN in the cells without stations with data that day.
+        """
+        days = values.shape[1]
+        if out is None:
+            out = np.empty((days,) + self.shape, dtype='float32')
+
+        for start in range(0, days, chunk):
+            block = values[:, start:start + chunk]
+            valid = ~np.isnan(block)
+
+            numerator = self._weights @ np.where(valid, block, 0.)
+            denominator = self._weights @ valid.astype('float64')
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                field = numerator / denominator
+
+            out[start:start + chunk] = field.T.reshape((-1,) + self.shape)
+
+        return out
+
+
+class GriddedField():
+    """Cube of daily values on a lat/lon grid, stored in a directory with a 
+    `values.npy` array (days × latitude × longitude) and a `grid.json` file 
+    with its axes and the parameters of the interpolation. The values are 
+    memory mapped when it is opened.
+
+    Attributes:
+
+        path(Path): Directory of the field.
+
+        values(np.memmap): Array (days × latitude × longitude), read only.
+
+        dates(pd.DatetimeIndex): Date of each day of the cube.
+
+        longitude(np.ndarray): Longitudes of the columns.
+
+        latitude(np.ndarray): Latitudes of the rows.
+
+        column(str): Variable of the stations that was interpolated.
+
+        params(dict): Column, first and last date, `k`, `power` and 
+            `max_distance_km` of the interpolation.
+
+    Methods:
+
+        write: Interpolates a field with an IDWGrid and stores it.
+
+        matches: Whether the field was interpolated with some axes and 
+            parameters.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+        with open(self.path.joinpath('grid.json'), 'r') as meta_file:
+            meta = json.load(meta_file)
+
+        self.column = meta['column']
+        self.longitude = np.array(meta['longitude'])
+        self.latitude = np.array(meta['latitude'])
+        self.values = np.load(self.path.joinpath('values.npy'), mmap_mode='r')
+        self.params = {
+            name: meta.get(name) for name in 
+            ('column', 'start', 'end', 'k', 'power', 'max_distance_km')
+        }
+
+        start = np.datetime64(meta['start'], 'D')
+        self.dates = pd.DatetimeIndex(
+            (start + np.arange(len(self.values))).astype('datetime64[ns]'), 
+            name='date'
+        )
+
+    def __getstate__(self):
+        # Only the location travels to other processes, they map the file.
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def matches(
+        self,
+        longitude: np.ndarray,
+        latitude: np.ndarray,
+        params: dict
+    ) -> bool:
+        """Whether the field has these axes and was interpolated with these 
+        `params` (the same keys as `params`).
+        """
+        return self.params == params \
+            and np.array_equal(self.longitude, longitude) \
+            and np.array_equal(self.latitude, latitude)
+
+    @classmethod
+    def write(
+        cls,
+        path: Path,
+        grid: IDWGrid,
+        values: np.ndarray,
+        start: date,
+        column: str
+    ) -> 'GriddedField':
+        """Interpolates the values of the stations and writes the cube 
+        directly into the mapped file, one chunk of days at a time.
+
+        Args:
+            path: Directory of the field. Previous files are replaced.
+
+            grid: The IDWGrid.
+
+            values: Array (stations × days) with the rows of `grid.numbers`.
+
+            start: Date of the first day.
+
+            column: Variable of the stations.
+
+        Returns:
+            The new GriddedField.
+        """
+        path = Path(path)
+        makedirs(path, exist_ok=True)
+
+        tmp_path = path.joinpath('.values.npy.tmp')
+        cube = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype='float32', 
+            shape=(values.shape[1],) + grid.shape
+        )
+        grid.interpolate(values, out=cube)
+        cube.flush()
+        del cube
+        replace(tmp_path, path.joinpath('values.npy'))
+
+        meta = {
+            'column': column, 
+            'start': str(pd.Timestamp(start).date()),
+            'end': str(
+                pd.Timestamp(start).date() + timedelta(values.shape[1] - 1)
+            ),
+            'longitude': grid.longitude.tolist(), 
+            'latitude': grid.latitude.tolist(),
+            'k': grid.k, 
+            'power': grid.power,
+            'max_distance_km': grid.max_distance_km,
+        }
+        with open(path.joinpath('grid.json'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+        return cls(path)
@@ -0,0 +1,743 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from os import cpu_count, makedirs, remove, replace, scandir, stat
+from pathlib import Path
+from datetime import date, datetime, timezone
+from time import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather, ipc
+
+from .cache import ORPHAN_GRACE_SECONDS, PIPELINE_VERSION
+from .parsers import STATION_COLUMNS, read_station_file
+
+
+# Encoding of the raw station files, the one they are downloaded with.
+RAW_ENCODING = 'cp1252'
+
+# Key of the schema metadata where the signature of the source is stored.
+SIGNATURE_KEY = b'rainfall.source'
+
+
+def file_digest(path: Path, chunk_size: int = 1 << 20) -> str:
+    """Hash of the content of a file, read by chunks."""
+    digest = blake2b(digest_size=16)
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def file_signature(path: Path) -> Dict[str, int]:
+    """Size and modification time of a file, used to detect changes without
+    reading it.
+    """
+    status = stat(path)
+    return {'size': status.st_size, 'mtime_ns': status.st_mtime_ns}
+
+
+def read_signature(cache_path: Path) -> Optional[dict]:
+    """Reads the signature stored in a cache file, only from its schema, or
+    None if the cache does not exist or it is not readable.
+    """
+    try:
+        with ipc.open_file(cache_path) as reader:
+            metadata = reader.schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+    if SIGNATURE_KEY not in metadata:
+        return None
+
+    return json.loads(metadata[SIGNATURE_KEY])
+
+
+def write_frame(
+    df: pd.DataFrame,
+    cache_path: Path,
+    signature: dict = None
+) -> None:
+    """Writes a data frame (index included) as a feather file, atomically and
+    with the `signature` of its source in the schema metadata.
+    """
+    table = pa.Table.from_pandas(df)
+    if signature is not None:
+        table = table.replace_schema_metadata(
+            (table.schema.metadata or {})
+            | {SIGNATURE_KEY: json.dumps(signature).encode()}
+        )
+
+    makedirs(cache_path.parent, exist_ok=True)
+    tmp_path = cache_path.with_name(f'.{cache_path.name}.tmp')
+    feather.write_feather(table, tmp_path)
+    replace(tmp_path, cache_path)
+
+
+def read_frame(cache_path: Path, columns: List[str] = None) -> pd.DataFrame:
+    """Reads a feather file written by `write_frame`, restoring the index. 
+    With `columns`, only those columns (and the index) are read.
+    """
+    if columns is not None:
+        with ipc.open_file(cache_path) as reader:
+            metadata = reader.schema.pandas_metadata or {}
+        index = [
+            name for name in metadata.get('index_columns', []) 
+            if isinstance(name, str)
+        ]
+        columns = index + list(columns)
+
+    return feather.read_table(cache_path, columns=columns).to_pandas()
+
+
+def load_station(
+    raw_path: Path,
+    cache_path: Path,
+    parse: Callable[[Path], pd.DataFrame] = read_station_file,
+    columns: List[str] = None
+) -> pd.DataFrame:
+    """Loads the data frame of a station from its feather cache, parsing the
+    raw file and refreshing the cache when it is missing or stale.
+
+    The size and modification time of the raw file are compared first; only
+    when the size is the same but the time is not, the content hash is
+    computed, so a file that was touched but not changed is not parsed again.
+    Caches written by another version of the parser are parsed again.
+
+    Args:
+        raw_path: Location of the raw `{number}.txt` file.
+
+        cache_path: Location of the feather cache of the station.
+
+        parse: Function that converts the raw file into the data frame.
+
+        columns: Only these columns are read from the cache. Default is all.
+
+    Returns:
+        DataFrame of the station.
+    """
+    cached = read_signature(cache_path)
+    current = file_signature(raw_path) \
+        | {'version': PIPELINE_VERSION['station']}
+
+    if cached is not None and cached.get('size') == current['size'] \
+            and cached.get('version') == current['version']:
+        if cached.get('mtime_ns') == current['mtime_ns']:
+            return read_frame(cache_path, columns)
+
+        digest = file_digest(raw_path)
+        if digest == cached.get('digest'):
+            # Same content, the new time is stored to skip the hash next time.
+            df_station = read_frame(cache_path)
+            write_frame(df_station, cache_path, current | {'digest': digest})
+            return df_station if columns is None else df_station[columns]
+
+    df_station = parse(raw_path)
+    write_frame(df_station, cache_path,
+                current | {'digest': file_digest(raw_path)})
+
+    return df_station if columns is None else df_station[columns]
+
+
+def _station_arrays(
+    paths: Tuple[Path, Path],
+    columns: List[str] = STATION_COLUMNS
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Loads a station in a worker process. Only two plain arrays are sent 
+    back, which are much cheaper to pickle than a data frame.
+    """
+    df_station = load_station(*paths, columns=columns)
+    dates = pd.DatetimeIndex(df_station.index).values.astype('datetime64[ns]')
+    return dates.view('i8'), df_station[columns].to_numpy('float64')
+
+
+def load_stations(
+    paths: List[Tuple[Path, Path]],
+    workers: int = None,
+    columns: List[str] = None
+) -> List[pd.DataFrame]:
+    """Loads many stations with `load_station`, parsing them across a pool of 
+    processes.
+
+    Args:
+        paths: List of pairs (raw path, cache path), one per station.
+
+        workers: Number of processes. Default is the number of CPUs; with 1 
+            the stations are loaded in the current process.
+
+        columns: Only these columns are read. Default is all.
+
+    Returns:
+        List with the DataFrame of each station, in the order of `paths`.
+    """
+    workers = workers or cpu_count() or 1
+    if workers == 1 or len(paths) < 2:
+        return [load_station(*pair, columns=columns) for pair in paths]
+
+    columns = columns or STATION_COLUMNS
+    workers = min(workers, len(paths))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_station_arrays, paths, 
+                               [columns] * len(paths),
+                               chunksize=max(1, len(paths) // (4 * workers)))
+
+        return [
+            pd.DataFrame(values, columns=columns,
+                         index=pd.DatetimeIndex(
+                             dates.view('datetime64[ns]'), name='date'))
+            for dates, values in results
+        ]
+
+
+# Manifest of downloads.
+
+class DownloadManifest():
+    """Record of the download of every raw station file: `number`, `url`, 
+    `bytes` and `checksum` of the local copy, `fetched_at` and `status` 
+    (`ok` or `failed`, with its `error`).
+
+    Each download is appended as one json line as soon as it finishes, so an 
+    interrupted download can be resumed exactly where it stopped. When a 
+    station appears more than once, its last line wins.
+
+    Attributes:
+
+        path(Path): Location of the json lines file.
+
+        entries(dict): Last entry of each station number.
+
+    Methods:
+
+        record: Adds the outcome of a download.
+
+        is_complete: Checks that the local copy of a station matches its 
+            entry.
+
+        pending: Filters the stations that still have to be downloaded.
+
+        compact: Rewrites the file with only the last entry of each station.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries = {}
+
+        if not self.path.is_file():
+            return
+
+        lines = 0
+        with open(self.path, 'r') as manifest_file:
+            for lines, line in enumerate(manifest_file, 1):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Line cut by an interruption.
+                    continue
+                self.entries[entry['number']] = entry
+
+        # Old entries are dropped once they are the majority of the file.
+        if lines > 2 * len(self.entries) + 100:
+            self.compact()
+
+    def _append(self, entry: dict) -> None:
+        makedirs(self.path.parent, exist_ok=True)
+        with open(self.path, 'a') as manifest_file:
+            manifest_file.write(json.dumps(entry) + '\n')
+        self.entries[entry['number']] = entry
+
+    def record(
+        self,
+        number: int,
+        url: str,
+        raw_path: Path,
+        ok: bool = True,
+        error: str = None,
+        fetched_at: datetime = None
+    ) -> dict:
+        """Adds the outcome of the download of a station. For successful 
+        downloads the size and the checksum of `raw_path` are stored.
+        """
+        entry = {
+            'number': int(number),
+            'url': url,
+            'bytes': None,
+            'checksum': None,
+            'fetched_at': (fetched_at or datetime.now(timezone.utc)).isoformat(),
+            'status': 'ok' if ok else 'failed',
+            'error': error,
+        }
+        if ok:
+            entry['bytes'] = stat(raw_path).st_size
+            entry['checksum'] = file_digest(raw_path)
+
+        self._append(entry)
+        return entry
+
+    def is_complete(
+        self,
+        number: int,
+        raw_path: Path,
+        verify: bool = False
+    ) -> bool:
+        """Checks that a station was downloaded and that its file still has 
+        the recorded size (and checksum, if `verify`).
+
+        A file without entry, left by a download made before the manifest 
+        existed, is adopted only if it has at least one row of data: it is 
+        recorded as it is (without url) and taken as complete. Otherwise, as 
+        it may be truncated or an error page, it is left pending.
+        """
+        entry = self.entries.get(number)
+
+        if not raw_path.is_file():
+            return False
+
+        if entry is None:
+            try:
+                readable = not read_station_file(raw_path, 
+                                                 RAW_ENCODING).empty
+            except (OSError, UnicodeDecodeError):
+                readable = False
+            if not readable:
+                return False
+
+            modified = datetime.fromtimestamp(stat(raw_path).st_mtime, 
+                                              timezone.utc)
+            self.record(number, None, raw_path, fetched_at=modified)
+            return True
+
+        if entry['status'] != 'ok' or stat(raw_path).st_size != entry['bytes']:
+            return False
+
+        return not verify or file_digest(raw_path) == entry['checksum']
+
+    def pending(
+        self,
+        raw_paths: Dict[int, Path],
+        verify: bool = False
+    ) -> List[int]:
+        """Numbers of the stations of `raw_paths` (number -> raw path) that 
+        are not complete.
+        """
+        return [
+            number for number, raw_path in raw_paths.items()
+            if not self.is_complete(number, raw_path, verify)
+        ]
+
+    def compact(self) -> None:
+        """Rewrites the file keeping only the last entry of each station."""
+        tmp_path = self.path.with_name(f'.{self.path.name}.tmp')
+        with open(tmp_path, 'w') as manifest_file:
+            for entry in self.entries.values():
+                manifest_file.write(json.dumps(entry) + '\n')
+        replace(tmp_path, self.path)
+
+
+# Nationwide archive of stations.
+
+ARCHIVE_SCHEMA = pa.schema(
+    [('number', pa.int64()), ('date', pa.timestamp('ns'))]
+    + [(column, pa.float64()) for column in STATION_COLUMNS]
+    + [('state', pa.string()), ('municipality', pa.string())]
+)
+
+ROWS_PER_GROUP = 1 << 16
+
+
+def _archive_schema(by_year: bool = False) -> pa.Schema:
+    if by_year:
+        return ARCHIVE_SCHEMA.append(pa.field('year', pa.int16()))
+    return ARCHIVE_SCHEMA
+
+
+def _partition_fields(by_year: bool = False) -> List[str]:
+    return ['state', 'municipality'] + (['year'] if by_year else [])
+
+
+def station_batch(
+    df_station: pd.DataFrame,
+    number: int,
+    state: str,
+    municipality: str,
+    by_year: bool = False
+) -> pa.RecordBatch:
+    """Converts the data frame of a station into a record batch with the
+    layout of the archive.
+    """
+    dates = pd.DatetimeIndex(df_station.index)
+    size = len(dates)
+
+    data = {'number': np.full(size, number, dtype='int64'), 'date': dates.values}
+    for column in STATION_COLUMNS:
+        data[column] = df_station[column].to_numpy(dtype='float64')
+    data['state'] = [state] * size
+    data['municipality'] = [municipality] * size
+    if by_year:
+        data['year'] = dates.year.to_numpy(dtype='int16')
+
+    schema = _archive_schema(by_year)
+    return pa.RecordBatch.from_arrays(
+        [pa.array(data[field.name], type=field.type) for field in schema],
+        schema=schema
+    )
+
+
+def write_archive(
+    batches: Iterable[pa.RecordBatch],
+    archive_dir: Path,
+    by_year: bool = False
+) -> None:
+    """Writes station batches into the parquet archive, partitioned by
+    `state` and `municipality` (and `year` when `by_year` is True).
+
+    The batches are consumed as they arrive, so the whole archive never has
+    to be in memory. The partitions that receive data are replaced, the rest
+    of the archive is left untouched.
+
+    Args:
+        batches: Record batches made with `station_batch`, ideally sorted by
+            station number and date so the statistics of the row groups are
+            useful to filter them.
+
+        archive_dir: Root directory of the archive.
+
+        by_year: Adds the year as the last partition level. It has to be the
+            same for every call over the same archive.
+    """
+    import pyarrow.dataset as ds
+
+    ds.write_dataset(
+        batches,
+        archive_dir,
+        schema=_archive_schema(by_year),
+        format='parquet',
+        partitioning=_partition_fields(by_year),
+        partitioning_flavor='hive',
+        existing_data_behavior='delete_matching',
+        basename_template='part-{i}.parquet',
+        min_rows_per_group=ROWS_PER_GROUP,
+        max_rows_per_group=ROWS_PER_GROUP,
+    )
+
+
+def read_archive(
+    archive_dir: Path,
+    state: str = '',
+    municipality: str = '',
+    numbers: List[int] = None,
+    date_interval: Tuple[date, date] = None,
+    columns: List[str] = None
+) -> pd.DataFrame:
+    """Reads a selection of the parquet archive.
+
+    Filters on the region (and on the year, when the archive has it) discard
+    whole partitions before opening them; filters on the station numbers and
+    dates are checked against the statistics of each row group, so only the
+    matching row groups and the requested columns are read.
+
+    Args:
+        archive_dir: Root directory of the archive.
+
+        state: Name of the state, as in the station catalog.
+
+        municipality: Name of the municipality, as in the station catalog.
+
+        numbers: List of station numbers.
+
+        date_interval: Tuple with the first and last dates. Any of them can be
+            empty to leave that side open.
+
+        columns: Columns among `rainfall`, `evaporation`, `max_t` and `min_t`.
+            Default is all of them.
+
+    Returns:
+        DataFrame indexed by `number` and `date`.
+    """
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(archive_dir, format='parquet', partitioning='hive')
+    has_year = 'year' in dataset.schema.names
+
+    condition = None
+
+    def _and(expression):
+        return expression if condition is None else condition & expression
+
+    if state:
+        condition = _and(ds.field('state') == state.upper())
+    if municipality:
+        condition = _and(ds.field('municipality') == municipality.upper())
+    if numbers is not None:
+        condition = _and(ds.field('number').isin(list(numbers)))
+
+    if date_interval:
+        start, end = date_interval
+        if start:
+            start = pd.Timestamp(start)
+            condition = _and(ds.field('date') >= pa.scalar(start, pa.timestamp('ns')))
+            if has_year:
+                condition = _and(ds.field('year') >= start.year)
+        if end:
+            end = pd.Timestamp(end)
+            condition = _and(ds.field('date') <= pa.scalar(end, pa.timestamp('ns')))
+            if has_year:
+                condition = _and(ds.field('year') <= end.year)
+
+    columns = list(columns) if columns else STATION_COLUMNS
+
+    table = dataset.to_table(columns=['number', 'date'] + columns,
+                             filter=condition)
+
+    return table.to_pandas().set_index(['number', 'date']).sort_index()
+
+
+# Memory mapped store of stations.
+
+class StationStore():
+    """Daily values of many stations packed in one contiguous memory mapped 
+    array, so any station can be read without parsing or building a data 
+    frame, and many processes can share the same pages of memory.
+
+    Each station takes a block of consecutive rows covering every day from 
+    its first to its last record (days without data are NaN), with one column 
+    per variable of `STATION_COLUMNS`. Days are counted on a shared national 
+    calendar, the number of days since 1970-01-01.
+
+    Attributes:
+
+        path(Path): Directory of the store, with `store.json` and the 
+            `values-{generation}.bin` and `index-{generation}.npy` files of 
+            the generation that it names.
+
+        values(numpy.memmap): Array of shape (rows, columns), read only.
+
+        index(numpy.ndarray): Table sorted by `number`, with the `offset` of 
+            the first row of each station, its `start` day and `length`.
+
+        columns(list): Names of the columns of `values`.
+
+    Methods:
+
+        write: Builds a store from station data frames.
+
+        series: View with the values of one station.
+
+        frame: DataFrame of one station, without copying its values.
+
+        matrix: Array (stations × days) of one column for an interval of days.
+    """
+
+    INDEX_DTYPE = np.dtype([('number', 'i8'), ('offset', 'i8'),
+                            ('start', 'i4'), ('length', 'i4')])
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+        with open(self.path.joinpath('store.json'), 'r') as meta_file:
+            meta = json.load(meta_file)
+
+        self.columns = meta['columns']
+        # Stores written before the generations have plain names.
+        suffix = f"-{meta['generation']}" if 'generation' in meta else ''
+        self.index = np.load(self.path.joinpath(f'index{suffix}.npy'))
+
+        shape = (meta['rows'], len(self.columns))
+        if meta['rows']:
+            self.values = np.memmap(self.path.joinpath(f'values{suffix}.bin'),
+                                    dtype=meta['dtype'], mode='r', shape=shape)
+        else:
+            # Empty files can not be mapped.
+            self.values = np.empty(shape, dtype=meta['dtype'])
+
+    def __getstate__(self):
+        # Only the location travels to other processes, they map the file.
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, number: int) -> bool:
+        position = np.searchsorted(self.index['number'], number)
+        return position < len(self.index) \
+            and self.index['number'][position] == number
+
+    @property
+    def numbers(self) -> np.ndarray:
+        return self.index['number']
+
+    @classmethod
+    def write(
+        cls,
+        path: Path,
+        frames: Iterable[Tuple[int, pd.DataFrame]],
+        dtype: str = 'float32'
+    ) -> 'StationStore':
+        """Builds a store from the data frames of the stations.
+
+        The frames are consumed one by one and appended to the values file, 
+        so the stations never have to be in memory all at once.
+
+        The values and the index of each write are new files named by a 
+        generation, and `store.json` is replaced last to point to them, so 
+        the store is always a complete old or new version, even if the write 
+        is interrupted. Readers that already mapped the old files keep them.
+
+        Args:
+            path: Directory of the store. Previous files are replaced.
+
+            frames: Iterable of pairs (number, DataFrame of the station).
+
+            dtype: Type of the stored values. Default is `float32`, the 
+                precision of the source data is only one decimal.
+
+        Returns:
+            The new StationStore.
+        """
+        path = Path(path)
+        makedirs(path, exist_ok=True)
+        generation = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')
+
+        rows = 0
+        entries = []
+        values_path = path.joinpath(f'values-{generation}.bin')
+        with open(values_path, 'wb') as values_file:
+            for number, df_station in frames:
+                df_station = df_station.dropna(how='all')
+                if df_station.empty:
+                    continue
+
+                days = pd.DatetimeIndex(df_station.index).values\
+                    .astype('datetime64[D]').astype('i8')
+                start = int(days.min())
+                length = int(days.max()) - start + 1
+
+                block = np.full((length, len(STATION_COLUMNS)), np.nan,
+                                dtype=dtype)
+                block[days - start] = df_station[STATION_COLUMNS]\
+                    .to_numpy(dtype=dtype)
+                values_file.write(block.tobytes())
+
+                entries.append((number, rows, start, length))
+                rows += length
+
+        index = np.array(entries, dtype=cls.INDEX_DTYPE)
+        index.sort(order='number')
+
+        meta = {'dtype': np.dtype(dtype).name, 'rows': rows, 
+                'columns': STATION_COLUMNS, 'generation': generation}
+
+        np.save(path.joinpath(f'index-{generation}.npy'), index)
+
+        # The generation published before is kept for the readers that 
+        # already read `store.json` or mapped its files.
+        try:
+            with open(path.joinpath('store.json'), 'r') as meta_file:
+                # '' is a store written before the generations.
+                previous = json.load(meta_file).get('generation', '')
+        except (OSError, ValueError):
+            previous = None
+
+        meta_tmp = path.joinpath(f'.store-{generation}.json.tmp')
+        with open(meta_tmp, 'w') as meta_file:
+            json.dump(meta, meta_file)
+        replace(meta_tmp, path.joinpath('store.json'))
+
+        cls._remove_old_generations(path, {generation, previous})
+
+        return cls(path)
+
+    @staticmethod
+    def _remove_old_generations(path: Path, kept: set) -> None:
+        """Removes the files of other generations, or of interrupted 
+        writes, once they are older than `ORPHAN_GRACE_SECONDS`: a newer file 
+        may be written by another process or still be opened by a reader. 
+        Files that can not be removed yet (mapped on Windows) are left for a 
+        later write.
+        """
+        now = time()
+        for entry in scandir(path):
+            name = entry.name
+            if name == '.values.bin.tmp' or name.endswith('.json.tmp'):
+                generation = None
+            elif name.startswith(('values-', 'index-')):
+                generation = name.split('-', 1)[1].rsplit('.', 1)[0]
+            elif name in ('values.bin', 'index.npy'):
+                generation = ''
+            else:
+                continue
+
+            if generation in kept - {None}:
+                continue
+            try:
+                if now - entry.stat().st_mtime > ORPHAN_GRACE_SECONDS:
+                    remove(entry.path)
+            except OSError:
+                continue
+
+    def _entry(self, number: int):
+        assert number in self, f"The station {number} is not in the store."
+        return self.index[np.searchsorted(self.index['number'], number)]
+
+    def series(self, number: int) -> np.ndarray:
+        """Read only view (days × columns) with the values of a station."""
+        entry = self._entry(number)
+        return self.values[entry['offset']:entry['offset'] + entry['length']]
+
+    def dates(self, number: int) -> pd.DatetimeIndex:
+        """Dates of the rows of `series(number)`."""
+        entry = self._entry(number)
+        days = np.arange(entry['start'], entry['start'] + entry['length'])
+        return pd.DatetimeIndex(days.astype('datetime64[D]'), name='date')
+
+    def frame(self, number: int) -> pd.DataFrame:
+        """DataFrame of a station built over the mapped values."""
+        return pd.DataFrame(self.series(number), index=self.dates(number),
+                            columns=self.columns, copy=False)
+
+    def matrix(
+        self,
+        column: str,
+        start: date,
+        end: date,
+        numbers: List[int] = None
+    ) -> np.ndarray:
+        """Aligns one column of many stations on the national calendar.
+
+        Args:
+            column: Name of the column.
+
+            start: First date.
+
+            end: Last date.
+
+            numbers: Station numbers, default is every station in the store.
+
+        Returns:
+            Array of shape (stations, days), NaN where a station has no data.
+        """
+        first = np.datetime64(pd.Timestamp(start).date(), 'D').astype('i8')
+        last = np.datetime64(pd.Timestamp(end).date(), 'D').astype('i8')
+        k = self.columns.index(column)
+
+        numbers = self.numbers if numbers is None else numbers
+        result = np.full((len(numbers), last - first + 1), np.nan,
+                         dtype=self.values.dtype)
+
+        for row, number in enumerate(numbers):
+            entry = self._entry(number)
+            lo = max(first, entry['start'])
+            hi = min(last, entry['start'] + entry['length'] - 1)
+            if lo > hi:
+                continue
+            offset = entry['offset'] + lo - entry['start']
+            result[row, lo - first:hi - first + 1] = \
+                self.values[offset:offset + hi - lo + 1, k]
+
+        return result
@@ -0,0 +1,386 @@
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from ..data.aggregation import gap_segments, nanmedian_rows
+from ..data.parsers import STATION_COLUMNS
+
+
+ROLLING_STATISTICS = ('mean', 'median', 'sum')
+
+# Length of the cycle of each seasonal encoding.
+SEASONAL_PERIODS = {'day_of_year': 365.25, 'month': 12}
+
+ANOMALY_KEYS = ('day_of_year', 'week', 'month')
+
+
+class FeatureSpec(NamedTuple):
+    """Declarative description of the features of a frame of daily or
+    periodic medians.
+
+    Attributes:
+
+        columns: Columns of the frame used by the lags, the rolling windows
+            and the anomalies.
+
+        keep_columns: Includes the values of the `columns` themselves.
+
+        lags: Rows to lag, as `{column}_lag{k}`.
+
+        rolling: Pairs (statistic, window) with a statistic of
+            `ROLLING_STATISTICS`, over the `window` rows that end in each
+            row, as `{column}_{statistic}{window}`.
+
+        seasonal: Cyclic encodings of the date, `day_of_year` or `month`,
+            as `{name}_sin` and `{name}_cos`.
+
+        rainy_counts: Windows (in rows) in which the rainy days are counted,
+            as `rainy_count{window}`.
+
+        anomalies: Includes the difference of each column with its mean on
+            the same part of the year, as `{column}_anomaly`.
+
+        anomaly_key: Part of the year of the anomalies: `day_of_year`,
+            `week` or `month`. Default is chosen by the spacing of the rows.
+
+        climatology: First and last dates of the rows used to compute the
+            means of the anomalies, for example only the training years.
+            Default is every row.
+
+        rainy_threshold: Rainfall in mm from which a day is rainy, when the
+            frame has no `rainy_days` column.
+
+        max_gap_days: Jump between rows from which the lags and windows do
+            not cross, as in `PeriodicMedians.skip_with_gaps`.
+
+    The columns that are targets of a model (the `targets` of
+    `FeatureBuilder.build` and `matrix`) are not kept, and their rolling
+    windows, anomalies and the rainy counts (if the target is `rainfall` or
+    `rainy_days`) end in the row before, so no feature holds the value that
+    is predicted.
+    """
+    columns: Tuple[str, ...] = tuple(STATION_COLUMNS)
+    keep_columns: bool = True
+    lags: Tuple[int, ...] = ()
+    rolling: Tuple[Tuple[str, int], ...] = ()
+    seasonal: Tuple[str, ...] = ()
+    rainy_counts: Tuple[int, ...] = ()
+    anomalies: bool = False
+    anomaly_key: Optional[str] = None
+    climatology: Optional[Tuple[date, date]] = None
+    rainy_threshold: float = 2.5
+    max_gap_days: int = 31
+
+
+def _window_sums(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum of the `window` rows that end in each row, from cumulative sums.
+    The first `window - 1` rows only sum the rows before them.
+    """
+    cumulative = np.concatenate(
+        [np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)]
+    )
+    rows = np.arange(1, len(values) + 1)
+    return cumulative[rows] - cumulative[np.maximum(rows - window, 0)]
+
+
+def _window_medians(values: np.ndarray, window: int) -> np.ndarray:
+    """Median, ignoring NaN, of the `window` rows that end in each row; NaN
+    in the first `window - 1` rows.
+    """
+    medians = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        # Windows × (rows, columns), without copying the values.
+        windows = sliding_window_view(values, window, axis=0)
+        medians[window - 1:] = nanmedian_rows(
+            windows.reshape(-1, window).T
+        ).reshape(-1, values.shape[1])
+    return medians
+
+
+class FeatureBuilder():
+    """Computes the features of a FeatureSpec over a frame of daily or
+    periodic medians.
+
+    Every feature comes from the same array of values, in a single pass:
+    the rolling sums and means and the rainy counts are differences of
+    cumulative sums, the medians use views of the windows, the lags are
+    taken by position and the anomalies are means by part of the year made
+    with `np.bincount`. The lags and windows do not cross the gaps between
+    rows, and the first rows of each stretch without gaps, which do not have
+    enough history, are left out.
+
+    Example:
+
+        spec = FeatureSpec(lags=(1, 2), rolling=(('mean', 4), ('sum', 12)),
+                           seasonal=('month',), rainy_counts=(4,),
+                           anomalies=True)
+        builder = FeatureBuilder(spec)
+
+        # The rainfall of each month from the months before and the other
+        # variables; `rainfall` itself is left out of the features.
+        features, targets = builder.matrix(periodic_medians,
+                                           targets=['rainfall'])
+        names = builder.names(targets=['rainfall'])
+
+    Attributes:
+
+        spec(FeatureSpec): Features to compute.
+
+    Methods:
+
+        names: Names of the features, in their order.
+
+        build: DataFrame of features with compact dtypes.
+
+        matrix: Contiguous float32 array of features for training.
+    """
+
+    def __init__(self, spec: FeatureSpec = FeatureSpec()):
+        unknown = {statistic for statistic, _ in spec.rolling} \
+            - set(ROLLING_STATISTICS)
+        assert not unknown, f"Unknown rolling statistics {unknown}."
+
+        unknown = set(spec.seasonal) - set(SEASONAL_PERIODS)
+        assert not unknown, f"Unknown seasonal encodings {unknown}."
+
+        assert spec.anomaly_key in ANOMALY_KEYS + (None,), \
+            f"Unknown anomaly key {spec.anomaly_key}."
+
+        windows = list(spec.lags) + list(spec.rainy_counts) \
+            + [window for _, window in spec.rolling]
+        assert min(windows, default=1) >= 1, \
+            "The lags and windows have to be positive."
+
+        self.spec = spec
+
+    def __repr__(self):
+        return f'FeatureBuilder({self.spec})'
+
+    def warmup(self, targets: Sequence[str] = ()) -> int:
+        """Rows at the start of each stretch without enough history."""
+        spec = self.spec
+        shift = 1 if targets else 0
+        return max(
+            list(spec.lags)
+            + [window - 1 + shift for _, window in spec.rolling]
+            + [window - 1 + shift for window in spec.rainy_counts]
+            + [shift] * spec.anomalies,
+            default=0
+        )
+
+    def names(self, targets: Sequence[str] = ()) -> List[str]:
+        """Names of the features, in the order of `build` and `matrix` with
+        the same `targets`.
+        """
+        spec = self.spec
+        names = [
+            column for column in spec.columns if column not in targets
+        ] if spec.keep_columns else []
+        for lag in spec.lags:
+            names += [f'{column}_lag{lag}' for column in spec.columns]
+        for statistic, window in spec.rolling:
+            names += [
+                f'{column}_{statistic}{window}' for column in spec.columns
+            ]
+        for window in spec.rainy_counts:
+            names.append(f'rainy_count{window}')
+        for name in spec.seasonal:
+            names += [f'{name}_sin', f'{name}_cos']
+        if spec.anomalies:
+            names += [f'{column}_anomaly' for column in spec.columns]
+        return names
+
+    def _anomaly_slots(self, dates: pd.DatetimeIndex) -> np.ndarray:
+        key = self.spec.anomaly_key
+        if key is None:
+            # By the usual distance between rows.
+            spacing = np.median(np.diff(dates.values)) if len(dates) > 1 \
+                else np.timedelta64(1, 'D')
+            key = 'day_of_year' if spacing <= np.timedelta64(1, 'D') \
+                else 'week' if spacing <= np.timedelta64(7, 'D') else 'month'
+
+        if key == 'month':
+            return dates.month.to_numpy(np.int64)
+        day_of_year = dates.dayofyear.to_numpy(np.int64)
+        return day_of_year if key == 'day_of_year' else (day_of_year - 1) // 7
+
+    def _features(
+        self,
+        df: pd.DataFrame,
+        targets: Sequence[str] = ()
+    ) -> Tuple[pd.DatetimeIndex, Dict[str, np.ndarray]]:
+        """Index of the rows kept and array of each feature, by name."""
+        spec = self.spec
+        missing = set(targets) - set(df.columns)
+        assert not missing, f"Unknown targets {missing}."
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        dates = pd.DatetimeIndex(df.index)
+        values = df[list(spec.columns)].to_numpy(dtype='float64')
+        size = len(values)
+
+        # Rows with enough history inside their stretch without gaps.
+        segments = gap_segments(dates, np.timedelta64(spec.max_gap_days, 'D'))
+        rows = np.arange(size)
+        starts = np.flatnonzero(np.r_[True, segments[1:] != segments[:-1]]) \
+            if size else rows
+        position = rows - np.repeat(starts, np.diff(np.r_[starts, size]))
+        kept = rows[position >= self.warmup(targets)]
+
+        columns = list(spec.columns)
+        features = {}
+
+        # Row of each column used in each kept row by the windows and the
+        # anomalies: the one before for the targets.
+        shift = np.array([column in targets for column in columns], dtype=int)
+        source = kept[:, None] - shift
+        by_column = np.arange(len(columns))
+
+        def add(names, block):
+            for name, column in zip(names, block.T):
+                features[name] = column
+
+        if spec.keep_columns:
+            for k, column in enumerate(columns):
+                if column not in targets:
+                    features[column] = values[kept, k]
+
+        for lag in spec.lags:
+            add([f'{column}_lag{lag}' for column in columns],
+                values[kept - lag])
+
+        if spec.rolling:
+            valid = ~np.isnan(values)
+            sums = {}
+            for statistic, window in spec.rolling:
+                names = [f'{column}_{statistic}{window}' for column in columns]
+                if statistic == 'median':
+                    add(names,
+                        _window_medians(values, window)[source, by_column])
+                    continue
+
+                if window not in sums:
+                    sums[window] = (
+                        _window_sums(np.where(valid, values, 0.), window),
+                        _window_sums(valid.astype('float64'), window)
+                    )
+                total, count = sums[window]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    block = total / count if statistic == 'mean' \
+                        else np.where(count > 0, total, np.nan)
+                add(names, block[source, by_column])
+
+        if spec.rainy_counts:
+            if 'rainy_days' in df.columns:
+                rainy = df['rainy_days'].fillna(0).to_numpy('float64')
+            else:
+                rainy = (df['rainfall'] >= spec.rainy_threshold)\
+                    .to_numpy('float64')
+            rainy_rows = kept - 1 \
+                if {'rainfall', 'rainy_days'} & set(targets) else kept
+            for window in spec.rainy_counts:
+                features[f'rainy_count{window}'] = \
+                    _window_sums(rainy, window)[rainy_rows]
+
+        for name in spec.seasonal:
+            cycle = dates.dayofyear if name == 'day_of_year' else dates.month
+            angle = 2 * np.pi * cycle.to_numpy('float64')[kept] \
+                / SEASONAL_PERIODS[name]
+            features[f'{name}_sin'] = np.sin(angle)
+            features[f'{name}_cos'] = np.cos(angle)
+
+        if spec.anomalies:
+            slots = self._anomaly_slots(dates)
+            reference = np.ones(size, dtype=bool)
+            if spec.climatology:
+                first, last = spec.climatology
+                if first:
+                    reference &= dates >= pd.Timestamp(first)
+                if last:
+                    reference &= dates <= pd.Timestamp(last)
+
+            bins = slots.max() + 1 if size else 0
+            for k, column in enumerate(columns):
+                used = reference & ~np.isnan(values[:, k])
+                sums = np.bincount(slots[used], values[used, k], bins)
+                counts = np.bincount(slots[used], minlength=bins)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    means = sums / counts
+                features[f'{column}_anomaly'] = \
+                    values[source[:, k], k] - means[slots[source[:, k]]]
+
+        return dates[kept], features
+
+    def build(
+        self,
+        source: Union[pd.DataFrame, object],
+        targets: Sequence[str] = ()
+    ) -> pd.DataFrame:
+        """Features of a frame.
+
+        Args:
+            source: Data frame indexed by date, or a DailyMedians or
+                PeriodicMedians whose `df` is used.
+
+            targets: Columns that a model predicts from the features, see
+                `FeatureSpec`.
+
+        Returns:
+            DataFrame with the columns of `names`, as float32 except the
+            rainy counts, which are the smallest integer type that fits.
+        """
+        df = getattr(source, 'df', source)
+        index, features = self._features(df, tuple(targets))
+
+        for name in list(features):
+            if name.startswith('rainy_count'):
+                top = features[name].max(initial=0)
+                features[name] = features[name].astype(
+                    np.int16 if top <= np.iinfo(np.int16).max else np.int32
+                )
+            else:
+                features[name] = features[name].astype(np.float32)
+
+        return pd.DataFrame(features, index=index,
+                            columns=self.names(targets))
+
+    def matrix(
+        self,
+        source: Union[pd.DataFrame, object],
+        targets: List[str] = None
+    ) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        """Features of a frame as a C contiguous float32 array (rows ×
+        features) in the order of `names`, filled without intermediate
+        data frames.
+
+        Args:
+            source: Data frame indexed by date, or a DailyMedians or
+                PeriodicMedians whose `df` is used.
+
+            targets: Columns of the frame returned as a float32 array of the
+                same rows. They are not features, and the windows and
+                anomalies that use them end in the row before, see
+                `FeatureSpec`.
+
+        Returns:
+            The array of features, and the array of targets if `targets`.
+        """
+        df = getattr(source, 'df', source)
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        index, features = self._features(df, tuple(targets or ()))
+
+        names = self.names(tuple(targets or ()))
+        result = np.empty((len(index), len(names)), dtype=np.float32)
+        for k, name in enumerate(names):
+            result[:, k] = features[name]
+
+        if targets is None:
+            return result
+
+        return result, np.ascontiguousarray(
+            df.loc[index, list(targets)].to_numpy(dtype=np.float32)
+        )
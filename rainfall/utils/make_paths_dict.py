@@ -3,6 +3,7 @@
 
 # Load custom library
 
+from functools import lru_cache
 from pathlib import Path
 
 here = Path(__file__).resolve()
@@ -26,7 +27,13 @@ def make_dict():
         'kml_path': local_dir('data', 'raw', f'{KMZ_NAME}.kml'),
         'unzip_path': local_dir('tmp', 'unzipped'),
         'df_stations_path': local_dir('data','processed', 'df_stations.ftr'),
+        'archive_dir': local_dir('data','processed', 'archive'),
+        'store_dir': local_dir('data','processed', 'station_store'),
+        'grids_dir': local_dir('data','processed', 'grids'),
+        'cache_dir': local_dir('data','processed', 'cache'),
         'url_base': lambda number: f'https://smn.conagua.gob.mx/tools/RESOURCES/Diarios/{number}.txt',
+        'http_validators_path': local_dir('data','raw', 'http_validators.json'),
+        'manifest_path': local_dir('data','raw', 'manifest.jsonl'),
         'download_dir_base': lambda state, municipality :\
             local_dir('data','raw', state, municipality),
         'interim_dir_base': lambda state, municipality : \
@@ -54,6 +61,11 @@ def make_dict():
     }
     return path_dict
 
+@lru_cache(maxsize=None)
+def get_dict():
+    """The dict of `make_dict`, built only once and on first use."""
+    return make_dict()
+
 def name_convention(*args):
     res = 'df_'
     for arg in args:
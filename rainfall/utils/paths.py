@@ -1,11 +1,9 @@
-from ast import Str
+from os import listdir
+from os.path import (exists, isfile)
 from pathlib import Path
-from typing import (
-    Callable
-)
-from xmlrpc.client import Boolean
+from shutil import copy, copytree
+from typing import (Callable, Sequence)
 
-from grpc import Call
 
 def make_dir_function(
     dir_name= '',
@@ -43,24 +41,17 @@ def make_dir_function(
     return dir_path
 
 project_dir = make_dir_function("")
+data_dir = make_dir_function(["data"])
+data_raw_dir = make_dir_function(["data", "raw"])
+data_processed_dir = make_dir_function(["data", "processed"])
+data_interim_dir = make_dir_function(["data", "interim"])
+data_external_dir = make_dir_function(["data", "external"])
+models_dir = make_dir_function(["models"])
+notebooks_dir = make_dir_function(["notebooks"])
+references_dir = make_dir_function(["references"])
+reports_dir = make_dir_function(["reports"])
+reports_figures_dir = make_dir_function(["reports", "figures"])
 
-for dir_type in [
-        ["data"],
-        ["data", "raw"],
-        ["data", "processed"],
-        ["data", "interim"],
-        ["data", "external"],
-        ["models"],
-        ["notebooks"],
-        ["references"],
-        ["reports"],
-        ["reports", "figures"]
-    ]:
-    dir_var = '_'.join(dir_type) + "_dir"
-    exec(f"{dir_var} = make_dir_function({dir_type})")
-
-from os import listdir
-from os.path import (exists, isfile)
 
 def is_valid(
     path: Path
@@ -82,12 +73,6 @@ def is_valid(
 
 
 
-from typing import (Callable, Sequence)
-from distutils.dir_util import copy_tree
-from os import listdir
-from shutil import copy
-
-
 def make_remote_copy_of_workspace_functions(
     local_path = '',
     remote_path = '', 
@@ -112,7 +97,7 @@ def make_remote_copy_of_workspace_functions(
 
     def update_from_remote(): 
         if local_dir() != remote_dir() and is_valid(remote_dir()):
-            copy_tree(str(remote_dir()), str(local_dir()))
+            copytree(remote_dir(), local_dir(), dirs_exist_ok=True)
             print('The remote files have been copied to the local repository.')
         
         else:
@@ -128,8 +113,8 @@ def make_remote_copy_of_workspace_functions(
         local_file_names = listdir(local_dir())
         for name in local_file_names:
             if (local_dir(name).is_dir() and name not in exception_list):
-                copy_tree(str(local_dir(name)),
-                        str(remote_dir(name)))
+                copytree(local_dir(name), remote_dir(name), 
+                         dirs_exist_ok=True)
     
 
     def update_notebook(to_remote=False):
@@ -19,7 +19,326 @@ mozilla = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:99.0) Gecko/20100101 Firefox/99.0'
 }
 
-from typing import List
+import codecs
+import json
+import random
+from locale import getpreferredencoding
+from os import replace
+from shutil import copyfileobj
+from time import time
+from threading import Thread
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+CHUNK_SIZE = 1 << 16
+
+# Encoding of the local copies, the one used by `open` to read them back.
+LOCAL_ENCODING = getpreferredencoding(False)
+
+
+class DownloadResult(NamedTuple):
+    """Outcome of the download of one url."""
+    url: str
+    ok: bool
+    path: Optional[Path] = None
+    status: Optional[int] = None
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+class Downloader():
+    """Downloads urls through a pool of connections that is reused between 
+    calls, retrying connection errors and server errors.
+
+    The coroutine methods can be awaited from any running event loop. The 
+    `*_sync` methods run them in a private event loop with its own thread, 
+    so they also work when the caller is already inside a loop (Jupyter or 
+    an asynchronous service).
+
+    Attributes:
+
+        limit: Maximum number of simultaneous connections.
+
+        limit_per_host: Maximum number of simultaneous connections to the 
+            same host.
+
+        retries: Times that a request is repeated after a connection error, 
+            a timeout or a 429/5xx response.
+
+        backoff: Base delay in seconds. The delay before the retry `k` is 
+            `backoff * 2**k` (capped at `max_backoff`), with half of it 
+            random to spread the retries.
+
+        http_ok: List of allowed http codes.
+
+        header: Provide the header, following the usual syntax of requests 
+            library.
+
+        encoding: Encoding of the text of the web page or file.
+
+        timeout: Seconds to wait to connect and between reads.
+
+    Methods:
+
+        get: Response of a url, after the retries.
+
+        download: Downloads one url into a directory.
+
+        download_all: Downloads many urls simultaneously.
+
+        download_all_sync: Blocking version of `download_all`.
+
+        run_sync: Runs any coroutine in the private loop.
+
+        close / close_sync: Closes the pools of connections.
+    """
+
+    def __init__(
+        self,
+        limit: int = 3,
+        limit_per_host: int = 3,
+        retries: int = 4,
+        backoff: float = 0.5,
+        max_backoff: float = 30.,
+        http_ok: List[int] = [200],
+        header: dict = mozilla,
+        encoding: str = 'utf-8',
+        timeout: float = 60.
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.http_ok = http_ok
+        self.header = header
+        self.encoding = encoding
+        self.timeout = timeout
+
+        # A session can only be used in the loop where it was created.
+        self._sessions = {}
+        self._loop = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close_sync()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def _session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit, limit_per_host=self.limit_per_host, 
+                ssl=False
+            )
+            session = aiohttp.ClientSession(
+                connector=connector, headers=self.header, trust_env=True,
+                timeout=aiohttp.ClientTimeout(
+                    total=None, sock_connect=self.timeout, 
+                    sock_read=self.timeout
+                )
+            )
+            self._sessions[loop] = session
+
+        return session
+
+    def _delay(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    @staticmethod
+    def _is_retryable(status: int) -> bool:
+        return status == 429 or status >= 500
+
+    async def get(
+        self,
+        url: str,
+        headers: dict = None
+    ) -> Tuple[aiohttp.ClientResponse, int]:
+        """Requests a url, retrying with exponential backoff.
+
+        Args:
+            url: Url to request.
+
+            headers: Extra headers of this request.
+
+        Returns:
+            The response, that has to be released by the caller (`async with 
+            response:`), and the number of attempts. The last exception is 
+            raised if all the attempts fail to connect.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = await self._session().get(url, headers=headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt > self.retries:
+                    raise
+            else:
+                if not self._is_retryable(response.status) \
+                        or attempt > self.retries:
+                    return response, attempt
+                response.release()
+
+            await asyncio.sleep(self._delay(attempt - 1))
+
+    async def save(
+        self,
+        response: aiohttp.ClientResponse,
+        path: Path,
+        append: bool = False,
+        consumed: int = 0
+    ) -> int:
+        """Streams the body of a response into a file, chunk by chunk, 
+        transcoding it from `encoding` to the encoding of the platform.
+
+        A new file is written to a temporary file next to `path` and renamed 
+        only when the whole body has arrived, so a failed download never 
+        replaces a good copy. With `append`, the chunks go to the end of 
+        `path` and the file is truncated back if the download fails. 
+        `consumed` is the number of bytes of the body already read by the 
+        caller.
+
+        Returns:
+            Number of bytes received.
+        """
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        target = path if append else path.with_name(f'.{path.name}.part')
+        start = target.stat().st_size if append else 0
+        received = 0
+
+        try:
+            async with aiofiles.open(target, mode='ab' if append else 'wb') as f:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    received += len(chunk)
+                    await f.write(decoder.decode(chunk).encode(LOCAL_ENCODING))
+                await f.write(decoder.decode(b'', final=True).encode(LOCAL_ENCODING))
+
+            # With a Content-Encoding the length is of the compressed body, 
+            # while the chunks are already decompressed.
+            encoded = response.headers.get('Content-Encoding', 'identity')\
+                .lower() != 'identity'
+            if response.content_length is not None and not encoded \
+                    and consumed + received != response.content_length:
+                raise aiohttp.ClientPayloadError(
+                    f'Received {consumed + received} of '
+                    f'{response.content_length} bytes.'
+                )
+
+        except BaseException:
+            if append:
+                with open(target, 'r+b') as f:
+                    f.truncate(start)
+            else:
+                target.unlink(missing_ok=True)
+            raise
+
+        if not append:
+            replace(target, path)
+
+        return received
+
+    async def download(self, url: str, download_dir: Path) -> DownloadResult:
+        """Downloads a url into `download_dir`, with the last part of the url 
+        as file name. The status is checked before anything is written, and 
+        the file only appears once it is complete.
+        """
+        path = download_dir.joinpath(url.rsplit('/', 1)[-1])
+        attempts = self.retries + 1
+
+        try:
+            response, attempts = await self.get(url)
+            async with response:
+                if response.status not in self.http_ok:
+                    return DownloadResult(url, False, status=response.status,
+                                          attempts=attempts,
+                                          error=f'HTTP {response.status}')
+
+                await self.save(response, path)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, 
+                UnicodeDecodeError) as error:
+            return DownloadResult(url, False, attempts=attempts,
+                                  error=repr(error))
+
+        return DownloadResult(url, True, path, response.status, attempts)
+
+    async def download_all(
+        self,
+        url_list: List[str],
+        download_dirs: List[Path],
+        on_result: Callable[[DownloadResult], None] = None
+    ) -> List[DownloadResult]:
+        """Downloads the urls simultaneously, limited by the pool.
+
+        Args:
+            url_list: List of urls to download.
+
+            download_dirs: List of file destinies.
+
+            on_result: Function called with each DownloadResult as soon as 
+                its download finishes, to keep track of the progress.
+
+        Returns:
+            List with the DownloadResult of each url, in the same order.
+        """
+        async def download_one(url, download_dir):
+            result = await self.download(url, download_dir)
+            if on_result is not None:
+                on_result(result)
+            return result
+
+        return await asyncio.gather(*[
+            download_one(url, download_dir)
+            for url, download_dir in zip(url_list, download_dirs)
+        ])
+
+    def run_sync(self, coroutine):
+        """Runs a coroutine in the private event loop of the downloader and 
+        waits for its result.
+        """
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+            Thread(target=self._loop.run_forever, daemon=True).start()
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def download_all_sync(
+        self,
+        url_list: List[str],
+        download_dirs: List[Path],
+        on_result: Callable[[DownloadResult], None] = None
+    ) -> List[DownloadResult]:
+        """Blocking version of `download_all`."""
+        return self.run_sync(
+            self.download_all(url_list, download_dirs, on_result)
+        )
+
+    async def close(self) -> None:
+        """Closes the pool of connections of the running loop."""
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    def close_sync(self) -> None:
+        """Closes the pool of the private loop and stops it."""
+        if self._loop is None or self._loop.is_closed():
+            return
+
+        self.run_sync(self.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
 
 def asyncronous_download_from_urls(
     url_list: list[str],
@@ -27,8 +346,10 @@ def asyncronous_download_from_urls(
     limit: int = 3,
     http_ok: List[int] = [200],
     header: dict = mozilla,
-    encoding: str = 'utf-8'
-) -> None:
+    encoding: str = 'utf-8',
+    downloader: Downloader = None,
+    on_result: Callable[[DownloadResult], None] = None
+) -> List[DownloadResult]:
     
 
     """Simultaneously downloads url lists. Only plain text files allowed.
@@ -46,54 +367,231 @@ def asyncronous_download_from_urls(
 
         encoding: Encoding of the text of the web page or file.
 
+        downloader: Downloader to use, so its pool of connections is reused. 
+            If it is given, the previous arguments are ignored.
+
+        on_result: Function called with each DownloadResult as soon as its 
+            download finishes.
+
     Returns:
-        A function that returns the path relative to a directory that can
-        receive `n` number of arguments for expansion.
+        List with the DownloadResult of each url.
     """
+    if downloader is not None:
+        return downloader.download_all_sync(url_list, download_dirs, on_result)
+
+    with Downloader(limit=limit, limit_per_host=limit, http_ok=http_ok, 
+                    header=header, encoding=encoding) as downloader:
+        return downloader.download_all_sync(url_list, download_dirs, on_result)
+
+
+
+
+def _read_validators(path: Path) -> Dict[str, dict]:
+    try:
+        with open(path, 'r') as validators_file:
+            return json.load(validators_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_validators(path: Path, validators: Dict[str, dict]) -> None:
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    with open(tmp_path, 'w') as validators_file:
+        json.dump(validators, validators_file)
+    tmp_path.replace(path)
+
+
+def incremental_download_from_urls(
+    url_list: List[str],
+    download_dirs: List[Path],
+    validators_path: Path,
+    limit: int = 3,
+    header: dict = mozilla,
+    encoding: str = 'utf-8',
+    overlap: int = 256,
+    head: int = 1024,
+    full_refresh_days: float = 30,
+    downloader: Downloader = None
+) -> Dict[str, str]:
+    """Refreshes local copies of append-mostly plain text files, downloading 
+    only what changed since the previous call.
+
+    The ETag, Last-Modified and size of every url are kept in a json file.
+    With them each request is conditional (`If-None-Match` and 
+    `If-Modified-Since`) and, when the server accepts ranges, asks only for 
+    the bytes after the known size, without content encoding so the sizes 
+    and offsets are bytes of the file. An append changes the validators, so 
+    the range can not be conditional on them (`If-Range`); instead the file 
+    is checked to be the same one plus new rows:
+
+        - The range starts `overlap` bytes early, and those bytes are 
+          compared with the end of the local copy.
+
+        - The first `head` bytes of the server are requested too and 
+          compared with the start of the local copy, where the corrections 
+          of the history usually are.
+
+        - Every `full_refresh_days` the file is downloaded whole, which 
+          catches the changes in the middle of the history.
+
+    If a check fails, the file is downloaded again in full.
+
+    Args:
+        url_list: List of urls to download.
+
+        download_dirs: List of file destinies.
+
+        validators_path: Location of the json file with the validators.
+
+        limit: of simultaneous downloads. Default 3.
+
+        header: Provide the header, following the usual syntax of requests library.
+
+        encoding: Encoding of the text of the web page or file.
+
+        overlap: Number of bytes already known requested with each range.
+
+        head: Number of bytes at the start of the file compared after each 
+            range. 0 does not compare them.
+
+        full_refresh_days: Days after which a file is downloaded whole 
+            again instead of by range.
+
+        downloader: Downloader to use, so its pool of connections and its 
+            retries are reused. If it is given, `limit`, `header` and 
+            `encoding` are ignored.
+
+    Returns:
+        Dict with the outcome of each url: `not_modified`, `appended`, 
+        `downloaded` or `failed`.
+    """
+    validators = _read_validators(validators_path)
+
+    def _update(url, response, size, refreshed):
+        validators[url] = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'accept_ranges': response.headers.get('Accept-Ranges') == 'bytes'
+                or response.status == 206,
+            'bytes': size,
+            'refreshed': refreshed,
+        }
+
+    def _local_matches(content, path, at_end):
+        # The local copy was transcoded, the server bytes are compared the 
+        # same way.
+        expected = content.decode(downloader.encoding, errors='replace')\
+            .encode(LOCAL_ENCODING)
+        with open(path, 'rb') as local_file:
+            if at_end:
+                local_file.seek(0, 2)
+                local_file.seek(max(local_file.tell() - len(expected), 0))
+            return local_file.read(len(expected)) == expected
+
+    async def head_matches(url, path):
+        response, _ = await downloader.get(url, {
+            'Accept-Encoding': 'identity', 'Range': f'bytes=0-{head - 1}'
+        })
+        async with response:
+            if response.status not in (200, 206):
+                return False
+            content = await response.content.read(head)
+        return _local_matches(content, path, at_end=False)
 
+    def _total_size(response, start, received):
+        content_range = response.headers.get('Content-Range', '')
+        total = content_range.rsplit('/', 1)[-1]
+        return int(total) if total.isdigit() else start + received
 
-    async def scrape(url_list, download_dirs):
-        tasks = list()
-        sem = asyncio.Semaphore(limit)
+    async def refresh(url_list, download_dirs):
+        return await asyncio.gather(*[
+            refresh_safe(url, download_dir)
+            for url, download_dir in zip(url_list, download_dirs)
+        ])
 
-        async with aiohttp.ClientSession(trust_env=True, headers=header) as session:
-            for url, download_dir in zip(url_list, download_dirs):
-                task = asyncio.ensure_future(scrape_bounded(url, download_dir,
-                                                            sem, session))
-                tasks.append(task)
+    async def refresh_safe(url, download_dir):
+        try:
+            return url, await refresh_one(url, download_dir)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError,
+                UnicodeDecodeError, asyncio.IncompleteReadError):
+            return url, 'failed'
 
-            result = await asyncio.gather(*tasks)
+    async def refresh_one(url, download_dir):
+        path = download_dir.joinpath(url.rsplit('/', 1)[-1])
+        known = validators.get(url) if path.is_file() else None
 
-        return result
+        now = time()
+        headers = {}
+        start = 0
+        if known:
+            # The offsets are bytes of the file, not of a compressed body.
+            headers['Accept-Encoding'] = 'identity'
+            if known.get('etag'):
+                headers['If-None-Match'] = known['etag']
+            if known.get('last_modified'):
+                headers['If-Modified-Since'] = known['last_modified']
+            due = now - known.get('refreshed', 0) \
+                > full_refresh_days * 24 * 3600
+            if known.get('accept_ranges') and known.get('bytes') and not due:
+                start = max(known['bytes'] - overlap, 0)
+                headers['Range'] = f'bytes={start}-'
 
-    async def scrape_bounded(url, download_dir, sem, session):
-        async with sem:
-            new_line = await scrape_one(url, download_dir, session)
-            return new_line
+        response, _ = await downloader.get(url, headers)
+        async with response:
+            if response.status == 304:
+                return 'not_modified'
 
+            if response.status == 206:
+                # The bytes already known are checked against the local copy.
+                known_part = await response.content.readexactly(
+                    known['bytes'] - start
+                )
+                tail = None
+                if _local_matches(known_part, path, at_end=True):
+                    # The new bytes are kept aside until the start of the 
+                    # file is checked, with the connection released.
+                    tail = path.with_name(f'.{path.name}.tail')
+                    received = await downloader.save(
+                        response, tail, consumed=len(known_part)
+                    )
+                    size = _total_size(response, known['bytes'], received)
 
-    async def scrape_one(url, download_dir, session):
-        file_name = url.rsplit('/', 1)[-1]
+            elif response.status not in (200, 416):
+                return 'failed'
 
-        try: 
-            async with session.get(url, verify_ssl=False) as response:
-                content = await response.text(encoding=encoding)
-                
-                # Saving files.
-                async with aiofiles.open(download_dir.joinpath(file_name),
-                                        mode = 'w') as f:
-                    await f.write(content)
+            elif response.status == 200:
+                size = await downloader.save(response, path)
+                _update(url, response, size, now)
+                return 'downloaded'
 
-        except aiohttp.client_exceptions.ClientConnectorError:
-            print('Scraping  failed due to the connection problem', url)
-            return False
+        if response.status == 206 and tail is not None:
+            try:
+                if not head or await head_matches(url, path):
+                    with open(tail, 'rb') as new_part, \
+                            open(path, 'r+b') as local_file:
+                        local_file.seek(0, 2)
+                        local_size = local_file.tell()
+                        try:
+                            copyfileobj(new_part, local_file)
+                        except BaseException:
+                            local_file.truncate(local_size)
+                            raise
+                    _update(url, response, size, known.get('refreshed', 0))
+                    return 'appended'
+            finally:
+                tail.unlink(missing_ok=True)
 
-        if response.status not in http_ok:
-            print('Scraping failed due to the return code ', url, response.status)
-            return False        
+        # The local copy does not match the server, it is downloaded again.
+        validators.pop(url, None)
+        return await refresh_one(url, download_dir)
 
-        return file_name
+    if downloader is None:
+        with Downloader(limit=limit, limit_per_host=limit, header=header, 
+                        encoding=encoding) as downloader:
+            outcomes = downloader.run_sync(refresh(url_list, download_dirs))
+    else:
+        outcomes = downloader.run_sync(refresh(url_list, download_dirs))
 
+    _write_validators(validators_path, validators)
 
-    loop = asyncio.get_event_loop()
-    lines = loop.run_until_complete(scrape(url_list, download_dirs))
\ No newline at end of file
+    return dict(outcomes)
@@ -1,8 +1,13 @@
-from invoke import task
+import json
+import statistics
+import sys
+from subprocess import run
+
+from invoke import Exit, task
 
 @task(help={
     'ip': 'IP to listen on, defaults to *',
-    'extra': 'Port to listen on, defaults to 8888',
+    'port': 'Port to listen on, defaults to 8888',
 })
 def lab(ctx, ip='*', port=8888):
     """Launch Jupyter lab
@@ -13,10 +18,78 @@ def lab(ctx, ip='*', port=8888):
 
 @task(help={
     'ip': 'IP to listen on, defaults to *',
-    'extra': 'Port to listen on, defaults to 8888',
+    'port': 'Port to listen on, defaults to 8888',
 })
 def notebook(ctx, ip='*', port=8888):
     """Launch Jupyter notebook
     """
     cmd = ['jupyter notebook', '--ip={}'.format(ip), '--port={}'.format(port)]
-    ctx.run(' '.join(cmd))
\ No newline at end of file
+    ctx.run(' '.join(cmd))
+
+
+# Modules that importing the package must not load: they are only needed to 
+# download the data or by optional features.
+LAZY_MODULES = ['aiohttp', 'aiofiles', 'requests', 'grpc', 'xmlrpc', 
+                'distutils', 'pyarrow.dataset', 'sklearn', 'scipy', 'regex']
+
+# Dependencies that the package always needs, their time is not counted.
+BASE_MODULES = ['numpy', 'pandas', 'pyarrow', 'pyarrow.feather']
+
+_TIMER = """
+import json, sys, time
+start = time.perf_counter()
+{base}
+base = time.perf_counter()
+import {module}
+end = time.perf_counter()
+print(json.dumps({{'base': base - start, 'seconds': end - base, 
+                  'modules': list(sys.modules)}}))
+"""
+
+
+def _import_seconds(module, repeat):
+    """Median times, in fresh processes, of importing the base modules and 
+    then the module over them, and the modules loaded by the last process.
+    Both are measured in the same process, so the time of the module does 
+    not depend on the noise of separate runs.
+    """
+    code = _TIMER.format(
+        base='\n'.join(f'import {name}' for name in BASE_MODULES),
+        module=module
+    )
+    results = [
+        json.loads(run([sys.executable, '-c', code], check=True, 
+                       capture_output=True, text=True).stdout)
+        for _ in range(max(int(repeat), 1))
+    ]
+
+    return (
+        statistics.median(result['base'] for result in results),
+        statistics.median(result['seconds'] for result in results),
+        set(results[-1]['modules'])
+    )
+
+
+@task(help={
+    'module': 'Module to import, defaults to rainfall.data.make_dataset',
+    'budget': 'Maximum milliseconds of the import, without the time of '
+              'numpy, pandas and pyarrow. Defaults to 150',
+    'repeat': 'Imports measured, the median is taken. Defaults to 5',
+})
+def import_time(ctx, module='rainfall.data.make_dataset', budget=150, 
+                repeat=5):
+    """Checks the import time of the package against a budget.
+
+    It also fails if the networking or optional libraries are imported.
+    """
+    base, seconds, loaded = _import_seconds(module, repeat)
+    own = seconds * 1000
+
+    print(f'{module}: {own:.0f} ms over {base * 1000:.0f} ms of '
+          f'{", ".join(BASE_MODULES)} (budget {budget} ms)')
+
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    if eager:
+        raise Exit(f'Imported eagerly: {", ".join(eager)}', code=1)
+    if own > float(budget):
+        raise Exit(f'Over the budget of {budget} ms.', code=1)
@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rainfall.data.aggregation import (
+    daily_median,
+    frame_hash,
+    gap_segments,
+    lag_frame,
+    sketch_median,
+    station_source,
+    update_daily_median,
+)
+from rainfall.data.parsers import STATION_COLUMNS
+
+
+def _stations(seed=0, count=6):
+    """Stations with different spans, missing days, missing values and a
+    repeated date, like the raw files.
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for k in range(count):
+        start = pd.Timestamp('1980-01-01') + pd.Timedelta(days=40 * k)
+        index = pd.date_range(start, periods=700, freq='D', name='date')\
+            .astype('datetime64[ns]')
+        index = index[rng.random(len(index)) > 0.1]
+        values = rng.gamma(1, 3, (len(index), len(STATION_COLUMNS))).round(1)
+        values[rng.random(values.shape) < 0.2] = np.nan
+        frames.append(pd.DataFrame(values, index=index,
+                                   columns=STATION_COLUMNS))
+    frames[0] = pd.concat([frames[0], frames[0].iloc[[10]] + 1.])
+
+    return frames
+
+
+def test_daily_median_matches_concat_groupby():
+    frames = _stations()
+    expected = pd.concat(frames, axis=0).groupby('date').median()
+
+    pd.testing.assert_frame_equal(daily_median(frames), expected,
+                                  check_freq=False)
+    assert daily_median([frame.iloc[:0] for frame in frames]).empty
+
+
+def _signature(df_station):
+    # The hash of the data stands for the digest of the raw file.
+    return {'digest': frame_hash(df_station)}
+
+
+def _update(df_cached, previous, frames, median):
+    """Incremental update as `DailyMedians.update` does it."""
+    sources, spans = [], []
+    for k, df_station in enumerate(frames):
+        source, span = station_source(df_station, _signature(df_station),
+                                      previous[k])
+        sources.append(source)
+        if span is not None:
+            spans.append(span)
+    spans = np.array(spans)
+    bounds = np.array([(source['first'], source['last'])
+                       for source in sources])
+
+    return update_daily_median(
+        df_cached, lambda: frames,
+        int(spans[:, 0].min()), int(spans[:, 1].max()),
+        (int(bounds[:, 0].min()), int(bounds[:, 1].max())), median
+    )[0]
+
+
+@pytest.mark.parametrize('median', [daily_median, sketch_median])
+def test_update_matches_full_recompute(median):
+    frames = _stations()
+    df_cached = median(frames).interpolate(method='time')
+    previous = [station_source(df_station, _signature(df_station))[0]
+                for df_station in frames]
+
+    # New days appended to a station and a corrected day of another one.
+    appended = _stations(seed=1, count=1)[0]
+    appended.index = appended.index + pd.Timedelta(days=1200)
+    frames[1] = pd.concat([frames[1], appended])
+    frames[3] = frames[3].copy()
+    frames[3].iloc[300] = [99.9, np.nan, 1., 0.]
+
+    expected = median(frames).interpolate(method='time')
+    pd.testing.assert_frame_equal(
+        _update(df_cached, previous, frames, median), expected,
+        check_freq=False
+    )
+
+
+def _old_skip(df, independent_vars, n):
+    """`skip` before it was vectorized, it changes `df`."""
+    for column in independent_vars:
+        df.insert(0, f'{column}_copy', df[column].copy(), True)
+    dependent_vars = [column for column in df.columns
+                      if column not in independent_vars]
+    df_x = df[dependent_vars].iloc[:-n]
+    df_x.index = df[dependent_vars].index[n:]
+
+    return pd.concat([df_x, df[independent_vars].iloc[n:]], axis=1)
+
+
+def _old_skip_with_gaps(df, independent_vars, n):
+    """`skip_with_gaps` before it was vectorized: `skip` on each interval 
+    between the gaps of more than 31 days, without the last period.
+    """
+    deltas = df.index.to_series().diff()[1:]
+    gaps = deltas[deltas > pd.Timedelta(days=31)].index.to_list()
+    gaps = [df.index[0]] + gaps + [df.index[-1]]
+
+    return pd.concat([
+        _old_skip(df[(df.index >= gaps[k]) & (df.index < gaps[k + 1])].copy(),
+                  independent_vars, n)
+        for k in range(len(gaps) - 1)
+    ])
+
+
+def _periods(rows, seed=0):
+    """Weekly medians with some gaps of more than 31 days."""
+    rng = np.random.default_rng(seed)
+    steps = np.where(rng.random(rows - 1) < 0.1,
+                     rng.integers(32, 400, rows - 1), 7)
+    index = pd.DatetimeIndex(
+        np.datetime64('1950-01-02', 'D') + np.r_[0, np.cumsum(steps)],
+        name='date'
+    ).astype('datetime64[ns]')
+    df = pd.DataFrame(rng.random((rows, len(STATION_COLUMNS))),
+                      index=index, columns=STATION_COLUMNS)
+    df['rainy_days'] = rng.integers(0, 7, rows)
+    df['day_of_year'] = index.dayofyear.astype(int)
+
+    return df
+
+
+@pytest.mark.parametrize('n', [1, 2, 3])
+def test_lag_frame_matches_skip_loop(n):
+    independent_vars = ['rainfall', 'rainy_days']
+    df = _periods(300)
+    before = df.copy()
+
+    # As skip_with_gaps: the last period is left out.
+    df_lagged = lag_frame(df.iloc[:-1], independent_vars, n,
+                          gap_segments(df.index[:-1]))
+    pd.testing.assert_frame_equal(
+        df_lagged, _old_skip_with_gaps(df, independent_vars, n),
+        check_freq=False
+    )
+    # As skip: a single segment.
+    pd.testing.assert_frame_equal(
+        lag_frame(df, independent_vars, n),
+        _old_skip(df.copy(), independent_vars, n)
+    )
+    pd.testing.assert_frame_equal(df, before)
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+from rainfall.data.parsers import STATION_COLUMNS
+from rainfall.features.build_features import FeatureBuilder, FeatureSpec
+
+
+def _frame(seed=0):
+    """Daily values with a gap longer than a month in the middle."""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('1990-01-01', periods=600, freq='D', name='date')\
+        .delete(range(200, 260))
+    return pd.DataFrame(rng.gamma(1, 3, (len(index), 4)), index=index,
+                        columns=STATION_COLUMNS)
+
+
+SPEC = FeatureSpec(lags=(1, 2), rolling=(('mean', 4), ('median', 3)),
+                   seasonal=('month',), rainy_counts=(4,), anomalies=True)
+
+
+def _by_segment(df):
+    return df.groupby(
+        (df.index.to_series().diff() > pd.Timedelta(days=31)).cumsum().values
+    )
+
+
+def test_features_match_pandas_within_segments():
+    df = _frame()
+    features = FeatureBuilder(SPEC).build(df)
+    groups = _by_segment(df)
+
+    for column in STATION_COLUMNS:
+        expected = {
+            f'{column}_lag2': groups[column].shift(2),
+            f'{column}_mean4': groups[column].transform(
+                lambda series: series.rolling(4).mean()
+            ),
+            f'{column}_median3': groups[column].transform(
+                lambda series: series.rolling(3).median()
+            ),
+        }
+        for name, values in expected.items():
+            np.testing.assert_allclose(features[name],
+                                       values.loc[features.index], rtol=1e-5)
+
+
+def test_targets_are_not_features():
+    df = _frame()
+    builder = FeatureBuilder(SPEC)
+    features, targets = builder.matrix(df, targets=['rainfall'])
+    names = builder.names(targets=['rainfall'])
+
+    assert 'rainfall' not in names
+    assert features.dtype == np.float32 and features.flags.c_contiguous
+    for k, name in enumerate(names):
+        assert not np.allclose(features[:, k], targets[:, 0]), name
+
+    # The windows of the target end in the row before.
+    df_features = builder.build(df, targets=['rainfall'])
+    groups = _by_segment(df)
+    expected = groups['rainfall'].transform(
+        lambda series: series.rolling(4).mean().shift(1)
+    )
+    np.testing.assert_allclose(df_features['rainfall_mean4'],
+                               expected.loc[df_features.index], rtol=1e-5)
+    expected = groups['rainfall'].transform(
+        lambda series: (series >= 2.5).astype(float).rolling(4).sum().shift(1)
+    )
+    np.testing.assert_allclose(df_features['rainy_count4'],
+                               expected.loc[df_features.index])
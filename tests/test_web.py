@@ -0,0 +1,120 @@
+import asyncio
+import os
+import socket
+import threading
+
+import pytest
+from aiohttp import web
+
+from rainfall.utils.web import incremental_download_from_urls
+
+
+ROWS = ''.join(
+    f'{day:02d}/01/1970\t{day}.0\t3.0\t27.0\t10.0\n' for day in range(1, 29)
+)
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Serves the files of `tmp_path / 'server'` like a static web server,
+    with ETag, Last-Modified and ranges.
+    """
+    root = tmp_path.joinpath('server')
+    root.mkdir()
+
+    async def station_file(request):
+        return web.FileResponse(root.joinpath(request.match_info['name']))
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.router.add_get('/{name}', station_file)
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, '127.0.0.1', port).start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    yield root, f'http://127.0.0.1:{port}'
+
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.run_until_complete(runner.cleanup())
+    loop.close()
+
+
+def _refresh(tmp_path, url, **kwargs):
+    download_dir = tmp_path.joinpath('raw')
+    download_dir.mkdir(exist_ok=True)
+    return incremental_download_from_urls(
+        [url], [download_dir], tmp_path.joinpath('validators.json'),
+        encoding='latin-1', **kwargs
+    )[url], download_dir.joinpath(url.rsplit('/', 1)[-1])
+
+
+def _touch_later(path, seconds=2):
+    # Last-Modified has a resolution of one second.
+    status = path.stat()
+    os.utime(path, ns=(status.st_atime_ns,
+                       status.st_mtime_ns + seconds * 10 ** 9))
+
+
+def test_append_is_downloaded_by_range(tmp_path, server):
+    root, base = server
+    station = root.joinpath('10001.txt')
+    station.write_bytes(ROWS.encode() * 50)
+    url = f'{base}/10001.txt'
+
+    outcome, local = _refresh(tmp_path, url)
+    assert outcome == 'downloaded'
+
+    outcome, local = _refresh(tmp_path, url)
+    assert outcome == 'not_modified'
+
+    with open(station, 'ab') as station_file:
+        station_file.write(b'29/01/1970\t1.0\t3.0\t27.0\t10.0\n')
+    _touch_later(station)
+
+    outcome, local = _refresh(tmp_path, url)
+    assert outcome == 'appended'
+    assert local.read_bytes() == station.read_bytes()
+
+
+def test_change_of_history_is_downloaded_whole(tmp_path, server):
+    root, base = server
+    station = root.joinpath('10002.txt')
+    station.write_bytes(ROWS.encode() * 50)
+    url = f'{base}/10002.txt'
+    _refresh(tmp_path, url)
+
+    # A correction at the start of the file and a new row.
+    content = station.read_bytes()
+    station.write_bytes(b'31/12/1969' + content[10:]
+                        + b'29/01/1970\t1.0\t3.0\t27.0\t10.0\n')
+    _touch_later(station)
+
+    outcome, local = _refresh(tmp_path, url)
+    assert outcome == 'downloaded'
+    assert local.read_bytes() == station.read_bytes()
+
+
+def test_change_in_the_middle_is_found_by_the_full_refresh(tmp_path, server):
+    root, base = server
+    station = root.joinpath('10003.txt')
+    station.write_bytes(ROWS.encode() * 50)
+    url = f'{base}/10003.txt'
+    _refresh(tmp_path, url)
+
+    content = bytearray(station.read_bytes())
+    middle = len(content) // 2
+    content[middle:middle + 1] = b'9' if content[middle:middle + 1] != b'9' \
+        else b'8'
+    station.write_bytes(bytes(content) + b'29/01/1970\t1.0\t3.0\t27.0\t10.0\n')
+    _touch_later(station)
+
+    outcome, local = _refresh(tmp_path, url, full_refresh_days=0)
+    assert outcome == 'downloaded'
+    assert local.read_bytes() == station.read_bytes()